@@ -0,0 +1,4 @@
+from software_store_app.asgi import create_asgi_app
+
+# Production entry point: uvicorn asgi:app --workers 4
+app = create_asgi_app()
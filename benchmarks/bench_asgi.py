@@ -0,0 +1,244 @@
+"""Threaded WSGI serving versus the ASGI mode at high connection counts.
+
+Seeds a database like benchmarks/harness.py, then serves it with uvicorn
+twice: once as the plain WSGI app on a pool of ASGI_WSGI_WORKERS threads
+(how every request ran before asgi.py) and once through asgi.py, where the
+storefront's index, login and purchase views run on the event loop against
+an async engine. Each scenario keeps --connections keep-alive connections
+busy until --requests responses have arrived and reports requests per
+second and p50/p95/p99 latency per mode.
+
+    python -m benchmarks.bench_asgi --scale 100k --db /tmp/bench-100k.db --connections 1000
+
+The load generator shares the machine with the server, so compare modes
+within one run rather than against other machines.
+"""
+import argparse
+import asyncio
+import http.cookiejar
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+import uuid
+
+from benchmarks.common import emit, latency_summary
+from benchmarks.harness import PASSWORD, SCALES, _email, seed
+from software_store_app import create_app, db
+from software_store_app.licensing import refill_pool
+
+MODES = ('wsgi', 'asgi')
+SCENARIOS = ('index', 'purchase', 'login')
+
+
+def app_config(path, settings):
+    return dict({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.abspath(path),
+        # Same overrides as the harness: one address logging in very fast, and
+        # emails only enqueued
+        'AUTH_RATE_LIMIT_PER_IP': (10 ** 9, 10 ** 9),
+        'AUTH_RATE_LIMIT_PER_ACCOUNT': (10 ** 9, 10 ** 9),
+        'JOBS_WORKERS': 0,
+    }, **settings)
+
+
+# Runs in the server subprocess
+def serve(mode, path, port, settings):
+    import uvicorn
+    config = app_config(path, settings)
+    if mode == 'asgi':
+        from software_store_app.asgi import create_asgi_app
+        app = create_asgi_app(config)
+    else:
+        from a2wsgi import WSGIMiddleware
+        flask_app = create_app(config)
+        app = WSGIMiddleware(flask_app, workers=flask_app.config['ASGI_WSGI_WORKERS'])
+    uvicorn.run(app, host='127.0.0.1', port=port, log_level='error', backlog=4096)
+
+
+def start_server(mode, path, settings):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    command = [sys.executable, '-m', 'benchmarks.bench_asgi', '--serve', mode, '--db', path, '--port', str(port)]
+    for name, value in settings.items():
+        command += ['--set', '%s=%s' % (name, json.dumps(value))]
+    process = subprocess.Popen(command)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, port
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('%s server did not start' % mode)
+
+
+def login_cookie(port, user_id):
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    data = urllib.parse.urlencode({'email': _email(user_id), 'password': PASSWORD}).encode()
+    opener.open('http://127.0.0.1:%d/login' % port, data).read()
+    return '; '.join('%s=%s' % (cookie.name, cookie.value) for cookie in jar)
+
+
+def build_request(method, path, body=None, cookie=None):
+    lines = ['%s %s HTTP/1.1' % (method, path), 'Host: 127.0.0.1']
+    if cookie:
+        lines.append('Cookie: ' + cookie)
+    if body is not None:
+        lines += ['Content-Type: application/x-www-form-urlencoded', 'Content-Length: %d' % len(body)]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode() + (body or b'')
+
+
+def request_factory(name, counts, rng, cookie):
+    if name == 'index':
+        return lambda: build_request('GET', '/')
+    if name == 'purchase':
+        return lambda: build_request('POST', '/purchase/%d' % rng.randint(1, counts['software']),
+                                     urllib.parse.urlencode({'idempotency_key': uuid.uuid4().hex}).encode(), cookie)
+    if name == 'login':
+        return lambda: build_request('POST', '/login', urllib.parse.urlencode(
+            {'email': _email(rng.randint(1, counts['users'])), 'password': PASSWORD}).encode())
+    raise ValueError('Unknown scenario: %s' % name)
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    return status, headers.get('connection') == 'close'
+
+
+# Keeps `connections` connections sending requests back to back until
+# `requests` responses have arrived in total.
+async def drive(port, connections, requests, make_request, timeout):
+    remaining = [requests]
+    samples = []
+    statuses = {}
+
+    async def connection():
+        reader = writer = None
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            started = time.perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(make_request())
+                status, closed = await asyncio.wait_for(read_response(reader), timeout)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as e:
+                status, closed = type(e).__name__, True
+            samples.append((time.perf_counter() - started) * 1000)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if closed and writer is not None:
+                writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*[connection() for _ in range(connections)])
+    elapsed = time.perf_counter() - started
+    errors = sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 400)
+    return {
+        'requests': requests,
+        'errors': errors,
+        'statuses': dict(sorted(statuses.items())),
+        'throughput_rps': round(requests / elapsed, 1),
+        'latency': latency_summary(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=sorted(SCALES), default='1k')
+    parser.add_argument('--db', help='SQLite file to seed or reuse; defaults to a temporary file.')
+    parser.add_argument('--mode', action='append', choices=MODES, help='Repeatable; defaults to both.')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help='Repeatable; defaults to index and purchase.')
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=5000, help='Measured requests per scenario.')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Seconds before a request counts as failed.')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='Override an app setting (value parsed as JSON), e.g. --set ASGI_WSGI_WORKERS=32.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--serve', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    settings = {}
+    for item in args.set:
+        name, _, value = item.partition('=')
+        try:
+            settings[name] = json.loads(value)
+        except ValueError:
+            settings[name] = value
+    if args.serve:
+        serve(args.serve, args.db, args.port, settings)
+        return
+
+    counts = SCALES[args.scale]
+    rng = random.Random(args.seed)
+    tmp = None
+    path = args.db
+    if path is None:
+        tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp.name, 'bench.db')
+    app = create_app(app_config(path, settings))
+    seed(app, counts, rng)
+    scenarios = args.scenario or ['index', 'purchase']
+
+    report = {
+        'benchmark': 'asgi',
+        'scale': args.scale,
+        'connections': args.connections,
+        'settings': settings,
+        'modes': {},
+    }
+    for mode in args.mode or MODES:
+        if 'purchase' in scenarios:
+            with app.app_context():
+                refill_pool(size=args.requests)
+                db.session.commit()
+        process, port = start_server(mode, path, settings)
+        try:
+            cookie = login_cookie(port, rng.randint(1, counts['users']))
+            results = {}
+            for name in scenarios:
+                make_request = request_factory(name, counts, rng, cookie)
+                results[name] = asyncio.run(drive(port, args.connections, args.requests, make_request, args.timeout))
+            report['modes'][mode] = results
+        finally:
+            process.terminate()
+            process.wait()
+
+    with app.app_context():
+        db.engine.dispose()
+    if tmp is not None:
+        tmp.cleanup()
+    emit(report)
+
+
+if __name__ == '__main__':
+    main()
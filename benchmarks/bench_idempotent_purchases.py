@@ -0,0 +1,103 @@
+"""Concurrent POST /api/purchases with repeated idempotency keys.
+
+Every key is sent --repeats times from different threads at once; the run
+fails unless each key produced exactly one purchase and every response for a
+key carried the same license key.
+
+    python -m benchmarks.bench_idempotent_purchases --threads 32 --keys 1000 --repeats 3
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import emit, latency_summary
+from software_store_app import create_app, db
+from software_store_app.database import create_schema
+from software_store_app.models import IdempotencyKey, Purchase, Software, User
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--keys', type=int, default=1000)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmp, 'bench.db'), 'JOBS_WORKERS': 0})
+
+    with app.app_context():
+        create_schema(db)
+        user = User(username='bench', email='bench@example.com', password_hash='!')
+        software = Software(name='Bench', description='Benchmark product', price=1.0, license_key='BENCH')
+        db.session.add_all([user, software])
+        db.session.commit()
+        session_id, software_id = user.get_id(), software.id
+
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+            with local.client.session_transaction() as sess:
+                sess['_user_id'] = session_id
+                sess['_fresh'] = True
+        return local.client
+
+    def send(key):
+        start = time.perf_counter()
+        response = client().post(
+            '/api/purchases', json={'software_id': software_id}, headers={'Idempotency-Key': key}
+        )
+        return key, response.status_code, response.get_json(), (time.perf_counter() - start) * 1000
+
+    keys = [uuid.uuid4().hex for _ in range(args.keys)]
+    requests = keys * args.repeats
+    random.shuffle(requests)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        results = list(pool.map(send, requests))
+    elapsed = time.perf_counter() - start
+
+    license_keys = defaultdict(set)
+    statuses = defaultdict(int)
+    for key, status, body, _ in results:
+        statuses[status] += 1
+        if status in (200, 201):
+            license_keys[key].add(body['license_key'])
+
+    with app.app_context():
+        purchases = db.session.query(Purchase).count()
+        recorded = db.session.query(IdempotencyKey).count()
+
+    ok = (
+        statuses.get(201, 0) == args.keys
+        and purchases == args.keys
+        and recorded == args.keys
+        and all(len(license_keys[key]) == 1 for key in keys)
+    )
+    emit(dict(
+        benchmark='idempotent_purchases',
+        threads=args.threads,
+        requests=len(requests),
+        unique_keys=args.keys,
+        statuses={str(status): count for status, count in sorted(statuses.items())},
+        purchases=purchases,
+        exactly_once=ok,
+        requests_per_second=round(len(requests) / elapsed, 1),
+        latency_ms=latency_summary([r[3] for r in results]),
+    ))
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
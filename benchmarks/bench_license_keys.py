@@ -0,0 +1,45 @@
+"""License keys issued per second under concurrent purchases.
+
+    python -m benchmarks.bench_license_keys --threads 8 --purchases 5000
+"""
+import argparse
+import os
+import tempfile
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from benchmarks.common import concurrent_purchases, emit
+from software_store_app import db
+from software_store_app.config import Config
+from software_store_app.database import engine_options, install_sqlite_pragmas
+from software_store_app.licensing import refill_pool
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--purchases', type=int, default=5000)
+    parser.add_argument('--prefill', type=int, default=0, help='Keys pooled before the run starts.')
+    args = parser.parse_args()
+
+    config = {name: getattr(Config, name) for name in dir(Config) if name.isupper()}
+    with tempfile.TemporaryDirectory() as tmp:
+        config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        engine = create_engine(config['SQLALCHEMY_DATABASE_URI'], **engine_options(config))
+        install_sqlite_pragmas(engine, config)
+        db.metadata.create_all(engine)
+        if args.prefill:
+            with Session(engine) as session:
+                refill_pool(session, args.prefill)
+                session.commit()
+
+        result = concurrent_purchases(engine, args.threads, args.purchases)
+        engine.dispose()
+
+    result['keys_per_second'] = result.pop('purchases_per_second')
+    emit(dict(benchmark='license_keys', **result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Catalog search latency against a synthetic catalog.
+
+    python -m benchmarks.bench_search --rows 100000 --queries 500
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from benchmarks.common import WORDS, emit, latency_summary, synthetic_description, synthetic_name
+from software_store_app.models import Software
+from software_store_app.search import install_search, search_software
+
+
+def seed(engine, rows, rng, batch=5000):
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        for start in range(0, rows, batch):
+            conn.execute(Software.__table__.insert(), [
+                {
+                    'name': synthetic_name(rng),
+                    'description': synthetic_description(rng),
+                    'price': round(rng.uniform(1, 500), 2),
+                    'license_key': 'BENCH%015d' % i,
+                    'created_at': now,
+                }
+                for i in range(start, min(start + batch, rows))
+            ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine('sqlite:///' + os.path.join(tmp, 'bench.db'))
+        Software.__table__.create(engine)
+        install_search(engine)
+
+        started = time.perf_counter()
+        seed(engine, args.rows, rng)
+        seed_seconds = time.perf_counter() - started
+
+        samples = []
+        hits = 0
+        with Session(engine) as session:
+            for _ in range(args.queries):
+                # Mix of whole words, prefixes and two-word queries
+                words = [rng.choice(WORDS) for _ in range(rng.randint(1, 2))]
+                q = ' '.join(w[:rng.randint(3, len(w))] for w in words)
+                started = time.perf_counter()
+                hits += len(search_software(session, q, limit=args.limit))
+                samples.append((time.perf_counter() - started) * 1000)
+        engine.dispose()
+
+    emit({
+        'benchmark': 'search',
+        'rows': args.rows,
+        'seed_seconds': round(seed_seconds, 3),
+        'avg_hits': round(hits / args.queries, 2),
+        'latency': latency_summary(samples),
+    })
+
+
+if __name__ == '__main__':
+    main()
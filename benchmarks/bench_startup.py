@@ -0,0 +1,67 @@
+"""Application start-up cost: package import, create_app() and first request.
+
+Every sample runs in a fresh interpreter so module import time is measured
+cold, the way a new worker process sees it. The database is created once
+with `init-db` beforehand and is not part of the timings.
+
+    python -m benchmarks.bench_startup --runs 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import emit, latency_summary
+
+PROBE = r'''
+import json, sys, time
+start = time.perf_counter()
+from software_store_app import create_app
+imported = time.perf_counter()
+app = create_app({'SQLALCHEMY_DATABASE_URI': sys.argv[1]})
+created = time.perf_counter()
+status = app.test_client().get(sys.argv[2]).status_code
+finished = time.perf_counter()
+json.dump({
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (finished - created) * 1000,
+    'total_ms': (finished - start) * 1000,
+    'status': status,
+}, sys.stdout)
+'''
+
+
+def probe(uri, path):
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, uri, path],
+        check=True, capture_output=True, text=True, env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1'),
+    ).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/', help='URL requested after start-up.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        subprocess.run(
+            [sys.executable, '-m', 'flask', '--app', 'software_store_app', 'init-db'],
+            check=True, capture_output=True, env=dict(os.environ, DATABASE_URL=uri),
+        )
+        samples = [probe(uri, args.path) for _ in range(args.runs)]
+
+    report = {'benchmark': 'startup', 'runs': args.runs, 'path': args.path,
+              'statuses': sorted({s['status'] for s in samples})}
+    for phase in ('import_ms', 'create_app_ms', 'first_request_ms', 'total_ms'):
+        report[phase[:-3]] = latency_summary([s[phase] for s in samples])
+    emit(report)
+
+
+if __name__ == '__main__':
+    main()
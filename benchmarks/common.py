@@ -0,0 +1,103 @@
+import json
+import math
+import random
+import sys
+import threading
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+WORDS = [
+    'photo', 'video', 'audio', 'studio', 'editor', 'code', 'cloud', 'backup',
+    'secure', 'vault', 'office', 'suite', 'designer', 'pro', 'lite', 'render',
+    'music', 'mixer', 'notes', 'mail', 'sync', 'drive', 'scanner', 'monitor',
+    'network', 'firewall', 'compiler', 'debugger', 'paint', 'sketch', 'invoice',
+    'ledger', 'planner', 'tracker', 'stream', 'player', 'converter', 'archive',
+]
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def latency_summary(samples_ms):
+    return {
+        'count': len(samples_ms),
+        'mean_ms': round(sum(samples_ms) / len(samples_ms), 3) if samples_ms else None,
+        'p50_ms': round(percentile(samples_ms, 50), 3) if samples_ms else None,
+        'p95_ms': round(percentile(samples_ms, 95), 3) if samples_ms else None,
+        'p99_ms': round(percentile(samples_ms, 99), 3) if samples_ms else None,
+    }
+
+
+def synthetic_name(rng=random):
+    return ' '.join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(2, 3)))
+
+
+def synthetic_description(rng=random):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(12, 30))) + '.'
+
+
+def emit(report):
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+# Runs `purchases` purchase transactions (claim a license key, insert a
+# Purchase, commit) spread over `threads` threads, each with its own session.
+# Lock timeouts are rolled back and retried, and counted in the result.
+def concurrent_purchases(engine, threads, purchases):
+    from software_store_app.licensing import allocate_license_key
+    from software_store_app.models import Purchase
+
+    per_thread = purchases // threads
+    samples = []
+    keys = []
+    retries = [0]
+    lock = threading.Lock()
+
+    def buyer():
+        local_samples, local_keys, local_retries = [], [], 0
+        with Session(engine) as session:
+            for _ in range(per_thread):
+                started = time.perf_counter()
+                while True:
+                    try:
+                        key = allocate_license_key(session)
+                        session.execute(insert(Purchase), [{'user_id': 1, 'software_id': 1, 'license_key': key}])
+                        session.commit()
+                        break
+                    except OperationalError as e:
+                        session.rollback()
+                        if 'locked' not in str(e):
+                            raise
+                        local_retries += 1
+                local_samples.append((time.perf_counter() - started) * 1000)
+                local_keys.append(key)
+        with lock:
+            samples.extend(local_samples)
+            keys.extend(local_keys)
+            retries[0] += local_retries
+
+    workers = [threading.Thread(target=buyer) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'threads': threads,
+        'purchases': len(keys),
+        'unique_keys': len(set(keys)),
+        'lock_retries': retries[0],
+        'purchases_per_second': round(len(keys) / elapsed, 1),
+        'latency': latency_summary(samples),
+    }
@@ -0,0 +1,387 @@
+"""Load test of the store and editor hot paths against a seeded database.
+
+Seeds users, software and purchases at the chosen scale, then drives each
+scenario (/, /login, /purchase/<id>, /admin, the editor dashboard, a heavy
+buyer's /library) through the Flask test client or a local threaded WSGI
+server, and reports throughput, p50/p95/p99 latency, SQL statements per
+request and peak memory as JSON. With --baseline the run is compared
+against an earlier report and exits non-zero on regression.
+
+    python -m benchmarks.harness --scale 100k --db /tmp/bench-100k.db --output baseline.json
+    python -m benchmarks.harness --scale 100k --db /tmp/bench-100k.db --baseline baseline.json
+"""
+import argparse
+import http.cookiejar
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from benchmarks.common import emit, latency_summary, synthetic_description, synthetic_name
+from software_store_app import create_app, db
+from software_store_app.analytics import rebuild_rollups
+from software_store_app.database import create_schema
+from software_store_app.licensing import refill_pool
+from software_store_app.models import Purchase, Software, User
+from software_store_app.querycount import count_queries
+from software_store_app.security import hash_password
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak RSS is then omitted
+    resource = None
+
+# Rows seeded per scale. The catalog is a tenth of the user base.
+SCALES = {
+    '1k': {'users': 1000, 'software': 100, 'purchases': 1000},
+    '100k': {'users': 100000, 'software': 10000, 'purchases': 100000},
+    '1m': {'users': 1000000, 'software': 100000, 'purchases': 1000000},
+}
+
+SCENARIOS = ('index', 'login', 'purchase', 'admin', 'editor', 'library')
+
+# Every 20th seeded purchase goes to this user, so the library scenario
+# browses the licenses of a heavy buyer (5,000 of them at the 100k scale)
+HEAVY_BUYER = 2
+
+PASSWORD = 'benchmark-password'
+SEED_BATCH = 10000
+
+
+def seed(app, counts, rng):
+    with app.app_context():
+        create_schema(db)
+        if db.session.scalar(select(func.count()).select_from(User)) >= counts['users']:
+            return False
+        password_hash = hash_password(PASSWORD)
+        now = datetime.utcnow()
+        with db.engine.begin() as conn:
+            for start in range(0, counts['users'], SEED_BATCH):
+                conn.execute(insert(User), [
+                    {'username': 'user%07d' % i, 'email': 'user%07d@example.com' % i,
+                     'password_hash': password_hash, 'is_admin': i == 0}
+                    for i in range(start, min(start + SEED_BATCH, counts['users']))
+                ])
+            for start in range(0, counts['software'], SEED_BATCH):
+                conn.execute(insert(Software), [
+                    {'name': synthetic_name(rng), 'description': synthetic_description(rng),
+                     'price': round(rng.uniform(1, 500), 2), 'license_key': 'SEED-S%013d' % i,
+                     'created_at': now - timedelta(minutes=i)}
+                    for i in range(start, min(start + SEED_BATCH, counts['software']))
+                ])
+            for start in range(0, counts['purchases'], SEED_BATCH):
+                conn.execute(insert(Purchase), [
+                    {'user_id': HEAVY_BUYER if i % 20 == 0 else rng.randint(1, counts['users']),
+                     'software_id': rng.randint(1, counts['software']),
+                     'license_key': 'SEED-P%013d' % i, 'purchase_date': now - timedelta(seconds=i)}
+                    for i in range(start, min(start + SEED_BATCH, counts['purchases']))
+                ])
+        # Core inserts bypass the ORM hooks that maintain the rollups
+        rebuild_rollups(db.session)
+        db.session.commit()
+        return True
+
+
+class TestClientDriver:
+    def __init__(self, app):
+        self.app = app
+        self.client = app.test_client()
+
+    def login(self, user_id, email):
+        with self.app.app_context():
+            session_id = db.session.get(User, user_id).get_id()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = session_id
+            sess['_fresh'] = True
+
+    def get(self, path):
+        return self.client.get(path).status_code
+
+    def post(self, path, data):
+        return self.client.post(path, data=data).status_code
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPDriver:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect)
+
+    def login(self, user_id, email):
+        self.post('/login', {'email': email, 'password': PASSWORD})
+
+    def _open(self, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        try:
+            with self.opener.open(self.base_url + path, body) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def get(self, path):
+        return self._open(path)
+
+    def post(self, path, data):
+        return self._open(path, data)
+
+
+def _email(user_id):
+    return 'user%07d@example.com' % (user_id - 1)
+
+
+# Returns a callable issuing one request of the scenario and the user the
+# driver must be logged in as (None for anonymous scenarios).
+def scenario(name, counts, rng):
+    if name == 'index':
+        return (lambda d: d.get('/')), None
+    if name == 'login':
+        def login(d):
+            return d.post('/login', {'email': _email(rng.randint(1, counts['users'])), 'password': PASSWORD})
+        return login, None
+    if name == 'purchase':
+        def purchase(d):
+            return d.post('/purchase/%d' % rng.randint(1, counts['software']),
+                          {'idempotency_key': uuid.uuid4().hex})
+        return purchase, 'random'
+    if name == 'admin':
+        return (lambda d: d.get('/admin')), 1
+    if name == 'editor':
+        def editor(d):
+            status = d.get('/editor/')
+            for table in ('users', 'software', 'purchases'):
+                status = max(status, d.get('/editor/api/%s' % table))
+            return status
+        return editor, 1
+    if name == 'library':
+        return (lambda d: d.get('/library')), HEAVY_BUYER
+    raise ValueError('Unknown scenario: %s' % name)
+
+
+def run_scenario(name, make_driver, engine, counts, requests, concurrency, warmup, rng, trace_memory):
+    request, login_as = scenario(name, counts, rng)
+    drivers = []
+    for _ in range(concurrency):
+        driver = make_driver()
+        if login_as is not None:
+            user_id = rng.randint(1, counts['users']) if login_as == 'random' else login_as
+            driver.login(user_id, _email(user_id))
+        drivers.append(driver)
+    for i in range(warmup):
+        request(drivers[i % concurrency])
+
+    per_thread = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    samples = [[] for _ in range(concurrency)]
+    statuses = [{} for _ in range(concurrency)]
+
+    def worker(i):
+        for _ in range(per_thread[i]):
+            start = time.perf_counter()
+            status = request(drivers[i])
+            samples[i].append((time.perf_counter() - start) * 1000)
+            statuses[i][status] = statuses[i].get(status, 0) + 1
+
+    if trace_memory:
+        tracemalloc.start()
+    with count_queries(engine) as queries:
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+    merged = {}
+    for counts_by_status in statuses:
+        for status, count in counts_by_status.items():
+            merged[str(status)] = merged.get(str(status), 0) + count
+    result = {
+        'requests': requests,
+        'errors': sum(count for status, count in merged.items() if int(status) >= 400),
+        'statuses': dict(sorted(merged.items())),
+        'throughput_rps': round(requests / elapsed, 1),
+        'latency': latency_summary([s for thread_samples in samples for s in thread_samples]),
+        'queries_per_request': round(queries.count / requests, 2),
+    }
+    if trace_memory:
+        result['traced_peak_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    if resource is not None:
+        result['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+# Flags scenarios whose p95 latency rose, or whose throughput fell, by more
+# than `tolerance` relative to the baseline report.
+def compare(report, baseline, tolerance):
+    comparison = {}
+    regressions = []
+    for name, result in report['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if not base:
+            continue
+        p95_ratio = result['latency']['p95_ms'] / base['latency']['p95_ms'] if base['latency']['p95_ms'] else None
+        rps_ratio = result['throughput_rps'] / base['throughput_rps'] if base['throughput_rps'] else None
+        comparison[name] = {
+            'p95_ratio': round(p95_ratio, 3) if p95_ratio is not None else None,
+            'throughput_ratio': round(rps_ratio, 3) if rps_ratio is not None else None,
+        }
+        if 'queries_per_request' in base:
+            comparison[name]['queries_per_request'] = [base['queries_per_request'], result['queries_per_request']]
+        if (p95_ratio is not None and p95_ratio > 1 + tolerance) or \
+                (rps_ratio is not None and rps_ratio < 1 - tolerance):
+            regressions.append(name)
+    return comparison, regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=sorted(SCALES), default='1k')
+    parser.add_argument('--users', type=int, help='Override the scale preset.')
+    parser.add_argument('--software', type=int, help='Override the scale preset.')
+    parser.add_argument('--purchases', type=int, help='Override the scale preset.')
+    parser.add_argument('--db', help='SQLite file to seed or reuse; defaults to a temporary file.')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help='Repeatable; defaults to all scenarios.')
+    parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario.')
+    parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per scenario.')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--server', action='store_true',
+                        help='Drive a local threaded WSGI server over HTTP instead of the test client.')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='Report the tracemalloc peak per scenario (slows requests down).')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='Override an app setting (value parsed as JSON), e.g. --set USER_CACHE_TIMEOUT=0.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Also write the report to this file.')
+    parser.add_argument('--baseline', help='Report to compare against.')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='Allowed relative p95/throughput change before a scenario counts as regressed.')
+    args = parser.parse_args()
+
+    counts = dict(SCALES[args.scale])
+    for name in counts:
+        if getattr(args, name):
+            counts[name] = getattr(args, name)
+    rng = random.Random(args.seed)
+    settings = {}
+    for item in args.set:
+        name, _, value = item.partition('=')
+        try:
+            settings[name] = json.loads(value)
+        except ValueError:
+            settings[name] = value
+
+    tmp = None
+    path = args.db
+    if path is None:
+        tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp.name, 'bench.db')
+    app = create_app(dict({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.abspath(path),
+        # The harness logs in from one address far faster than any person
+        'AUTH_RATE_LIMIT_PER_IP': (10 ** 9, 10 ** 9),
+        'AUTH_RATE_LIMIT_PER_ACCOUNT': (10 ** 9, 10 ** 9),
+        # Emails are only enqueued; sending them is not part of the request path
+        'JOBS_WORKERS': 0,
+    }, **settings))
+
+    started = time.perf_counter()
+    seeded = seed(app, counts, rng)
+    seed_seconds = time.perf_counter() - started
+    with app.app_context():
+        engine = db.engine
+        scenarios = args.scenario or list(SCENARIOS)
+        if 'purchase' in scenarios:
+            refill_pool(size=args.requests + args.warmup)
+            db.session.commit()
+
+    server = None
+    if args.server:
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = 'http://127.0.0.1:%d' % server.server_port
+        make_driver = lambda: HTTPDriver(base_url)
+    else:
+        make_driver = lambda: TestClientDriver(app)
+
+    report = {
+        'benchmark': 'harness',
+        'driver': 'wsgi-server' if args.server else 'test-client',
+        'scale': args.scale,
+        'rows': counts,
+        'seeded': seeded,
+        'seed_seconds': round(seed_seconds, 3),
+        'concurrency': args.concurrency,
+        'settings': settings,
+        'environment': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'revision': _git_revision(),
+        },
+        'scenarios': {},
+    }
+    for name in scenarios:
+        report['scenarios'][name] = run_scenario(
+            name, make_driver, engine, counts, args.requests, args.concurrency, args.warmup, rng, args.trace_memory)
+
+    if server is not None:
+        server.shutdown()
+    with app.app_context():
+        db.engine.dispose()
+    if tmp is not None:
+        tmp.cleanup()
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        # Numbers from a different driver or data set are not comparable
+        report['baseline_matches'] = (
+            baseline.get('driver') == report['driver'] and baseline.get('rows') == report['rows'])
+        report['comparison'], regressions = compare(report, baseline, args.tolerance)
+        report['regressions'] = regressions
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    emit(report)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
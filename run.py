@@ -1,4 +1,6 @@
-from software_store_app import app
+from software_store_app import create_app
+
+app = create_app()
 
 if __name__ == '__main__':
     app.run(debug=True)
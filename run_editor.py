@@ -1,4 +1,7 @@
-from software_store_app.editor import editor_app as app
+from software_store_app import create_app
+
+# The editor is now a blueprint of the main app, served under /editor/
+app = create_app()
 
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
@@ -1,21 +1,63 @@
-from flask import Flask
+import os
+
+from flask import Flask, current_app
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from werkzeug.local import LocalProxy
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'aghrghealvn3451'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///software_store.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+from software_store_app.caching import create_cache
+from software_store_app.config import Config
+from software_store_app.database import init_database
 
 db = SQLAlchemy()
-db.init_app(app)
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'storefront.login'
+login_manager.blueprint_login_views = {'editor': 'editor.login'}
+
+# The cache belongs to whichever app is handling the current request or CLI
+# command; modules import this proxy instead of a global instance.
+cache = LocalProxy(lambda: current_app.extensions['cache'])
+
+
+# Builds the storefront and editor as one application. Nothing here touches
+# the database: the schema is created by `flask init-db`.
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    if isinstance(config, dict):
+        app.config.update(config)
+    elif config is not None:
+        app.config.from_object(config)
+    app.config['CACHE_DIR'] = app.config['CACHE_DIR'] or os.path.join(app.instance_path, 'cache')
+
+    init_database(app, db)
+    login_manager.init_app(app)
+    app.extensions['cache'] = create_cache(app.config)
+
+    from software_store_app.security import init_security
+    init_security(app)
+
+    from software_store_app.identity import init_identity
+    init_identity(app)
+
+    from software_store_app.metrics import init_metrics
+    init_metrics(app, db)
+
+    from software_store_app.jobs import init_jobs
+    init_jobs(app)
+
+    from software_store_app.assets import init_assets
+    init_assets(app)
+
+    from software_store_app.reads import init_reads
+    init_reads(app)
+
+    from software_store_app.routes import storefront
+    from software_store_app.editor import editor
+    app.register_blueprint(storefront)
+    app.register_blueprint(editor)
 
-# Initialize the database and models
-with app.app_context():
-    db.create_all()
+    from software_store_app.commands import register_commands
+    register_commands(app)
 
-# Import models and routes after database initialization
-from software_store_app import models, routes
+    return app
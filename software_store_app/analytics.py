@@ -0,0 +1,170 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import delete, event, func, insert, inspect, select
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.orm import Session
+
+from software_store_app import db
+from software_store_app.models import Purchase, SalesDaily, SalesTotal, Software
+
+# Revenue is counted at the product's list price when the purchase is
+# recorded (purchases do not store what was paid); a rebuild recounts the
+# whole history at current prices.
+
+
+def _day(value):
+    return (value if isinstance(value, datetime) else datetime.utcnow()).date()
+
+
+# Collects (software_id, day) -> purchase count deltas from a flush: new
+# purchases add one, deleted ones subtract one, and a purchase moved to
+# another product (editor edits) moves its count with it.
+def _flush_deltas(session):
+    deltas = defaultdict(int)
+    for obj in session.new:
+        if isinstance(obj, Purchase):
+            deltas[(obj.software_id, _day(obj.purchase_date))] += 1
+    for obj in session.deleted:
+        if isinstance(obj, Purchase):
+            deltas[(obj.software_id, _day(inspect(obj).dict.get('purchase_date')))] -= 1
+    for obj in session.dirty:
+        if isinstance(obj, Purchase):
+            history = inspect(obj).attrs.software_id.history
+            if history.deleted and history.added:
+                day = _day(obj.purchase_date)
+                deltas[(int(history.deleted[0]), day)] -= 1
+                deltas[(int(history.added[0]), day)] += 1
+    return {key: count for key, count in deltas.items() if count}
+
+
+def _upsert(conn, model, keys, rows):
+    dialect = conn.dialect.name
+    if dialect == 'sqlite':
+        stmt = sqlite.insert(model)
+        stmt = stmt.on_conflict_do_update(index_elements=keys, set_={
+            'purchases': model.purchases + stmt.excluded.purchases,
+            'revenue': model.revenue + stmt.excluded.revenue,
+        })
+    elif dialect in ('mysql', 'mariadb'):
+        stmt = mysql.insert(model)
+        stmt = stmt.on_duplicate_key_update(
+            purchases=model.purchases + stmt.inserted.purchases,
+            revenue=model.revenue + stmt.inserted.revenue,
+        )
+    else:
+        raise NotImplementedError('Sales rollups do not support %s' % dialect)
+    conn.execute(stmt, rows)
+
+
+# Runs inside the flush that writes the purchases, so the rollups commit or
+# roll back together with them.
+@event.listens_for(Session, 'after_flush')
+def _update_rollups(session, flush_context):
+    deltas = _flush_deltas(session)
+    if deltas:
+        apply_rollup_deltas(session.connection(), deltas)
+
+
+# Purchase counts per (software_id, day) of the purchases matching
+# `condition`, for writers that change purchases with set-based statements
+# and so bypass the flush hook.
+def purchase_counts(session, condition):
+    day = func.date(Purchase.purchase_date)
+    rows = session.execute(
+        select(Purchase.software_id, day, func.count())
+        .where(condition)
+        .group_by(Purchase.software_id, day)
+    )
+    counts = {}
+    for software_id, value, count in rows:
+        # SQLite hands back dates as strings from aggregate queries
+        value = value if isinstance(value, date) or value is None else date.fromisoformat(str(value))
+        counts[(software_id, value or _day(None))] = count
+    return counts
+
+
+# Adds (software_id, day) -> purchase count deltas to both rollup tables.
+def apply_rollup_deltas(conn, deltas):
+    software_ids = {software_id for software_id, _ in deltas}
+    prices = dict(conn.execute(select(Software.id, Software.price).where(Software.id.in_(software_ids))).all())
+
+    daily = []
+    totals = defaultdict(lambda: [0, 0.0])
+    for (software_id, day), count in sorted(deltas.items()):
+        revenue = count * prices.get(software_id, 0.0)
+        daily.append({'software_id': software_id, 'day': day, 'purchases': count, 'revenue': revenue})
+        totals[software_id][0] += count
+        totals[software_id][1] += revenue
+    _upsert(conn, SalesDaily, ['software_id', 'day'], daily)
+    _upsert(conn, SalesTotal, ['software_id'], [
+        {'software_id': software_id, 'purchases': count, 'revenue': revenue}
+        for software_id, (count, revenue) in sorted(totals.items())
+    ])
+
+
+# Recomputes both rollup tables from the purchase history in the caller's
+# transaction; used after bulk loads that bypass the ORM.
+def rebuild_rollups(session=None):
+    session = session or db.session
+    session.execute(delete(SalesDaily))
+    session.execute(delete(SalesTotal))
+    day = func.date(Purchase.purchase_date)
+    session.execute(insert(SalesDaily).from_select(
+        ['software_id', 'day', 'purchases', 'revenue'],
+        select(Purchase.software_id, day, func.count(Purchase.id), func.sum(Software.price))
+        .join(Software, Software.id == Purchase.software_id)
+        .group_by(Purchase.software_id, day),
+    ))
+    session.execute(insert(SalesTotal).from_select(
+        ['software_id', 'purchases', 'revenue'],
+        select(SalesDaily.software_id, func.sum(SalesDaily.purchases), func.sum(SalesDaily.revenue))
+        .group_by(SalesDaily.software_id),
+    ))
+    return session.scalar(select(func.count()).select_from(SalesTotal))
+
+
+def sales_by_software(session=None):
+    session = session or db.session
+    return dict(session.execute(select(SalesTotal.software_id, SalesTotal.purchases)).all())
+
+
+def top_sellers(limit=10, by='revenue', session=None):
+    session = session or db.session
+    column = SalesTotal.revenue if by == 'revenue' else SalesTotal.purchases
+    rows = session.execute(
+        select(Software.id, Software.name, SalesTotal.purchases, SalesTotal.revenue)
+        .join(Software, Software.id == SalesTotal.software_id)
+        .order_by(column.desc(), SalesTotal.software_id)
+        .limit(limit)
+    ).all()
+    return [
+        {'software_id': id, 'name': name, 'purchases': purchases, 'revenue': round(revenue, 2)}
+        for id, name, purchases, revenue in rows
+    ]
+
+
+# Daily purchase count and revenue for the last `days` days (today
+# included), optionally for one product. Days without sales are zero-filled.
+def revenue_series(days=30, software_id=None, session=None):
+    session = session or db.session
+    end = datetime.utcnow().date()
+    start = end - timedelta(days=days - 1)
+    query = (
+        select(SalesDaily.day, func.sum(SalesDaily.purchases), func.sum(SalesDaily.revenue))
+        .where(SalesDaily.day >= start)
+        .group_by(SalesDaily.day)
+    )
+    if software_id is not None:
+        query = query.where(SalesDaily.software_id == software_id)
+    found = {}
+    for day, purchases, revenue in session.execute(query):
+        # SQLite hands back dates as strings from aggregate queries
+        day = day if isinstance(day, date) else date.fromisoformat(str(day))
+        found[day] = (int(purchases), float(revenue))
+    series = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        purchases, revenue = found.get(day, (0, 0.0))
+        series.append({'day': day.isoformat(), 'purchases': purchases, 'revenue': round(revenue, 2)})
+    return series
@@ -0,0 +1,188 @@
+import asyncio
+import io
+import sys
+
+from a2wsgi import WSGIMiddleware
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import RequestRedirect
+
+from software_store_app import create_app, db
+from software_store_app.database import engine_options, install_sqlite_pragmas, is_sqlite
+
+# ASGI entry point for production (see asgi.py at the top of the project).
+#
+# Requests for ASYNC_ENDPOINTS (by default the storefront's index, login and
+# purchase) run on the event loop: the Flask view runs inside a greenlet
+# with db.session bound to an AsyncSession, so its queries go through an
+# async driver and a request waiting on the database no longer holds a
+# thread. Everything else, the editor included, is handed to the unchanged
+# WSGI application on a pool of ASGI_WSGI_WORKERS threads.
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'mysql': 'mysql+aiomysql',
+    'mariadb': 'mariadb+aiomysql',
+}
+
+
+def async_database_url(app):
+    if app.config['ASYNC_DATABASE_URL']:
+        return app.config['ASYNC_DATABASE_URL']
+    # Flask-SQLAlchemy has already resolved relative SQLite paths
+    with app.app_context():
+        url = db.engine.url
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError('No async driver known for %s; set ASYNC_DATABASE_URL' % backend)
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def create_async_database(app):
+    url = async_database_url(app)
+    options = engine_options(app.config)
+    if is_sqlite(url):
+        # Every async SQLite connection runs on its own thread; pool them
+        # like server connections
+        options.update(pool_size=app.config['DB_POOL_SIZE'], max_overflow=app.config['DB_MAX_OVERFLOW'],
+                       pool_timeout=app.config['DB_POOL_TIMEOUT'])
+    engine = create_async_engine(url, **options)
+    if is_sqlite(url):
+        install_sqlite_pragmas(engine.sync_engine, app.config)
+    if 'metrics' in app.extensions:
+        from software_store_app.metrics import instrument_engine
+        instrument_engine(engine.sync_engine)
+    return engine
+
+
+def _environ(scope, body):
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope['http_version'],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'asgi.scope': scope,
+    }
+    environ['SERVER_NAME'], port = scope.get('server') or ('localhost', 80)
+    environ['SERVER_PORT'] = str(port or 0)
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], port = scope['client']
+        environ['REMOTE_PORT'] = str(port)
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        value = value.decode('latin-1')
+        environ[name] = environ[name] + ',' + value if name in environ else value
+    return environ
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+class AsyncStorefront:
+    def __init__(self, app, engine):
+        self.app = app
+        self.engine = engine
+        self.endpoints = frozenset(app.config['ASYNC_ENDPOINTS'])
+        self.wsgi = WSGIMiddleware(app, workers=app.config['ASGI_WSGI_WORKERS'])
+        # One connection per request in flight; the rest wait here, where
+        # waiting is cheap, instead of timing out on the pool
+        self.slots = asyncio.Semaphore(app.config['DB_POOL_SIZE'] + app.config['DB_MAX_OVERFLOW'])
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http' and self._endpoint(scope) in self.endpoints:
+            await self._dispatch(scope, receive, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _endpoint(self, scope):
+        adapter = self.app.url_map.bind('localhost', script_name=scope.get('root_path') or None)
+        try:
+            endpoint, _ = adapter.match(scope['path'], scope['method'])
+        except (HTTPException, RequestRedirect):
+            return None
+        return endpoint
+
+    async def _dispatch(self, scope, receive, send):
+        body = await _read_body(receive)
+        if body is None:
+            return
+        environ = _environ(scope, body)
+        async with self.slots:
+            status, headers, content = await self._run(environ)
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+    # Mirrors Flask.wsgi_app, with the view, its error handling and reading
+    # the response body done inside AsyncSession.run_sync.
+    async def _run(self, environ):
+        app = self.app
+        ctx = app.request_context(environ)
+        error = None
+        ctx.push()
+        try:
+            async with AsyncSession(self.engine) as session:
+                db.session.registry.set(session.sync_session)
+                try:
+                    status, headers, content = await session.run_sync(self._respond, environ)
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    # Before ctx.pop(), whose teardown would close the
+                    # session outside the greenlet
+                    db.session.registry.clear()
+        finally:
+            if error is not None and app.should_ignore_error(error):
+                error = None
+            ctx.pop(error)
+        return status, headers, content
+
+    def _respond(self, sync_session, environ):
+        try:
+            response = self.app.full_dispatch_request()
+        except Exception as e:
+            response = self.app.handle_exception(e)
+        app_iter = response.get_app_iter(environ)
+        try:
+            content = b''.join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        headers = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                   for name, value in response.get_wsgi_headers(environ).to_wsgi_list()]
+        return response.status_code, headers, content
+
+
+def create_asgi_app(config=None):
+    app = create_app(config)
+    return AsyncStorefront(app, create_async_database(app))
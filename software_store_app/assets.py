@@ -0,0 +1,304 @@
+import gzip
+import hashlib
+import http.client
+import io
+import ipaddress
+import json
+import mimetypes
+import os
+import shutil
+import threading
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+
+from flask import abort, current_app, redirect, request, send_file, url_for
+
+from software_store_app import cache, db
+from software_store_app.jobs import enqueue, job
+from software_store_app.models import Software
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.map', '.txt', '.html')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Third-party assets the templates use. `flask build-assets --fetch-vendor`
+# downloads them into static/vendor so they are fingerprinted and served
+# like our own files; until then asset_url() points at the CDN.
+VENDOR = {
+    'vendor/bootstrap.min.css': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
+    'vendor/bootstrap.bundle.min.js': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+}
+
+# (width, height) of each thumbnail size; images are scaled to fit and
+# never enlarged.
+THUMBNAIL_SIZES = {
+    'card': (400, 300),
+    'small': (120, 90),
+}
+
+# Image version -> [lock, number of threads using it]; entries go once unused
+_thumbnail_locks = {}
+_thumbnail_locks_guard = threading.Lock()
+
+
+class UnsafeImageURL(ValueError):
+    pass
+
+
+def fetch_vendor_assets(static_folder):
+    for name, url in VENDOR.items():
+        path = os.path.join(static_folder, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with urllib.request.urlopen(url, timeout=30) as response, open(path, 'wb') as f:
+            shutil.copyfileobj(response, f)
+
+
+def _fingerprinted(name, data):
+    root, ext = os.path.splitext(name)
+    return '%s.%s%s' % (root, hashlib.sha256(data).hexdigest()[:12], ext)
+
+
+# Copies every file under `static_folder` into `output_dir` with its content
+# hash in the name, writes .gz and .br siblings for text assets, and records
+# logical -> fingerprinted names in manifest.json. Returns the manifest.
+def build_assets(static_folder, output_dir):
+    output_dir = os.path.abspath(output_dir)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        if os.path.abspath(root).startswith(output_dir):
+            continue
+        for filename in files:
+            source = os.path.join(root, filename)
+            name = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            target_name = _fingerprinted(name, data)
+            target = os.path.join(output_dir, target_name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(data)
+            if name.endswith(COMPRESSIBLE):
+                with open(target + '.gz', 'wb') as f:
+                    f.write(gzip.compress(data, 9))
+                if brotli is not None:
+                    with open(target + '.br', 'wb') as f:
+                        f.write(brotli.compress(data, quality=11))
+            manifest[name] = target_name
+    with open(os.path.join(output_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+# URL of a static file: the fingerprinted build when one exists, the plain
+# static file otherwise, and the CDN for vendor files not fetched yet.
+def asset_url(name):
+    manifest = current_app.extensions['assets_manifest']
+    if name in manifest:
+        return url_for('assets', filename=manifest[name])
+    if name in VENDOR and not os.path.exists(os.path.join(current_app.static_folder, name)):
+        return VENDOR[name]
+    return url_for('static', filename=name)
+
+
+# Serves built assets, preferring a pre-compressed variant the client
+# accepts. Names carry a content hash, so responses never need revalidation.
+def serve_asset(filename):
+    directory = current_app.config['ASSETS_DIR']
+    path = os.path.abspath(os.path.join(directory, filename))
+    if not path.startswith(os.path.abspath(directory) + os.sep) or not os.path.isfile(path):
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if candidate in request.accept_encodings and os.path.isfile(path + suffix):
+            path, encoding = path + suffix, candidate
+            break
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=True)
+    if encoding:
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = IMMUTABLE
+    return response
+
+
+def _image_version(image_url):
+    return hashlib.sha1(image_url.encode()).hexdigest()[:16]
+
+
+# Thumbnail URLs include a hash of the source URL, so editing a product's
+# image produces a new URL and thumbnails can be cached forever.
+def thumbnail_url(software_id, image_url, size='card'):
+    if not image_url:
+        return asset_url('img/placeholder.svg')
+    if Image is None or not image_url.startswith(('http://', 'https://')):
+        return image_url
+    return url_for('thumbnail', size=size, software_id=software_id, v=_image_version(image_url))
+
+
+def _thumbnail_path(version, size):
+    return os.path.join(current_app.config['THUMBNAIL_DIR'], '%s-%s.webp' % (version, size))
+
+
+@contextmanager
+def _thumbnail_lock(key):
+    with _thumbnail_locks_guard:
+        entry = _thumbnail_locks.get(key)
+        if entry is None:
+            entry = _thumbnail_locks[key] = [threading.Lock(), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _thumbnail_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _thumbnail_locks[key]
+
+
+# Product images are fetched on behalf of anonymous visitors, so they may
+# only come from public addresses. The address is checked once connected,
+# on every redirect too, so a DNS answer that changes after a check cannot
+# point the server at itself or the internal network.
+def _check_peer(sock):
+    address = ipaddress.ip_address(sock.getpeername()[0].split('%')[0])
+    if not address.is_global:
+        sock.close()
+        raise UnsafeImageURL('Image URL resolves to a non-public address: %s' % address)
+
+
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    def connect(self):
+        super().connect()
+        _check_peer(self.sock)
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    def connect(self):
+        super().connect()
+        _check_peer(self.sock)
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req, context=self._context)
+
+
+class _PublicRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if urllib.parse.urlsplit(newurl).scheme not in ('http', 'https'):
+            raise UnsafeImageURL('Image URL redirects to %s' % newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+# No proxies: the peer check needs to see the image host itself
+_image_opener = urllib.request.build_opener(
+    urllib.request.ProxyHandler({}), _PublicHTTPHandler, _PublicHTTPSHandler, _PublicRedirectHandler)
+
+
+def _download(url, max_bytes, timeout):
+    if urllib.parse.urlsplit(url).scheme not in ('http', 'https'):
+        raise UnsafeImageURL('Image URL must be http or https')
+    request_ = urllib.request.Request(url, headers={'User-Agent': 'SoftwareStore-Thumbnailer'})
+    with _image_opener.open(request_, timeout=timeout) as response:
+        data = response.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ValueError('Image larger than %d bytes' % max_bytes)
+    return data
+
+
+# Downloads and resizes one product image into every thumbnail size.
+# Concurrent requests for the same image wait for a single download.
+def generate_thumbnails(image_url):
+    version = _image_version(image_url)
+    paths = {size: _thumbnail_path(version, size) for size in THUMBNAIL_SIZES}
+    with _thumbnail_lock(version):
+        if all(os.path.exists(path) for path in paths.values()):
+            return paths
+        data = _download(image_url, current_app.config['THUMBNAIL_MAX_BYTES'],
+                         current_app.config['THUMBNAIL_FETCH_TIMEOUT'])
+        with Image.open(io.BytesIO(data)) as source:
+            source = source.convert('RGBA' if source.mode in ('RGBA', 'LA', 'P') else 'RGB')
+            os.makedirs(current_app.config['THUMBNAIL_DIR'], exist_ok=True)
+            for size, dimensions in THUMBNAIL_SIZES.items():
+                image = source.copy()
+                image.thumbnail(dimensions, Image.LANCZOS)
+                tmp = paths[size] + '.tmp'
+                image.save(tmp, 'WEBP', quality=current_app.config['THUMBNAIL_QUALITY'])
+                os.replace(tmp, paths[size])
+    return paths
+
+
+# Called in the transaction that sets a product's image so the first catalog
+# view finds the thumbnails ready.
+def enqueue_thumbnails(software, session=None):
+    if software.image_url and software.image_url.startswith(('http://', 'https://')):
+        enqueue('thumbnails', {'software_id': software.id}, session)
+
+
+@job('thumbnails')
+def prepare_thumbnails(payload):
+    software = db.session.get(Software, payload['software_id'])
+    if software is not None and software.image_url and Image is not None \
+            and software.image_url.startswith(('http://', 'https://')):
+        generate_thumbnails(software.image_url)
+
+
+def thumbnail(size, software_id):
+    if size not in THUMBNAIL_SIZES:
+        abort(404)
+    version = request.args.get('v', '')
+    path = _thumbnail_path(version, size) if version.isalnum() else None
+    if path is None or not os.path.exists(path):
+        software = db.session.get(Software, software_id)
+        if software is None or not software.image_url:
+            abort(404)
+        if _image_version(software.image_url) != version:
+            # Stale link from before the image changed
+            return redirect(thumbnail_url(software.id, software.image_url, size))
+        failed_key = 'thumbnail-failed:%s' % version
+        if cache.get(failed_key):
+            return redirect(software.image_url)
+        try:
+            path = generate_thumbnails(software.image_url)[size]
+        except Exception:
+            current_app.logger.warning('Could not make a thumbnail of %s', software.image_url, exc_info=True)
+            # Don't retry the download on every page view
+            cache.set(failed_key, True, timeout=300)
+            return redirect(software.image_url)
+    response = send_file(path, mimetype='image/webp', conditional=True, etag=True)
+    response.headers['Cache-Control'] = IMMUTABLE
+    return response
+
+
+def init_assets(app):
+    app.config['ASSETS_DIR'] = app.config['ASSETS_DIR'] or os.path.join(app.static_folder, 'dist')
+    app.config['THUMBNAIL_DIR'] = app.config['THUMBNAIL_DIR'] or os.path.join(app.instance_path, 'thumbnails')
+    app.extensions['assets_manifest'] = load_manifest(app.config['ASSETS_DIR'])
+    app.add_url_rule('/assets/<path:filename>', 'assets', serve_asset)
+    app.add_url_rule('/thumbnails/<size>/<int:software_id>', 'thumbnail', thumbnail)
+    app.jinja_env.globals.update(asset_url=asset_url, thumbnail_url=thumbnail_url)
@@ -0,0 +1,223 @@
+import csv
+import io
+import json
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from software_store_app import db
+from software_store_app.catalog import invalidate_catalog
+from software_store_app.changefeed import record_changes
+from software_store_app.licensing import allocate_license_keys
+from software_store_app.models import Purchase, Software
+
+FORMATS = ('csv', 'jsonl')
+
+# Exporters hand output to the server in chunks of roughly this many
+# characters rather than one write per row.
+FLUSH_SIZE = 64 * 1024
+
+# Columns written by the exporters, in order. Software exports round-trip
+# through import_software().
+EXPORTS = {
+    'software': (Software, ('id', 'name', 'description', 'price', 'image_url', 'license_key', 'created_at')),
+    'purchases': (Purchase, ('id', 'user_id', 'software_id', 'purchase_date', 'license_key')),
+}
+
+
+class ImportReport:
+    def __init__(self, max_errors=1000):
+        self.inserted = 0
+        self.errors = []
+        self.error_count = 0
+        self.max_errors = max_errors
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'error': message})
+
+    def to_dict(self):
+        return {
+            'inserted': self.inserted,
+            'failed': self.error_count,
+            'errors': self.errors,
+        }
+
+
+def detect_format(filename, default='csv'):
+    if filename and filename.lower().endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if filename and filename.lower().endswith('.csv'):
+        return 'csv'
+    return default
+
+
+# Readers yield (line number, record) one row at a time; a record that cannot
+# be parsed is yielded as an Exception so it is reported against its line.
+def iter_csv(stream):
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def iter_jsonl(stream):
+    for line_no, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, ValueError('Invalid JSON: %s' % e)
+            continue
+        if not isinstance(record, dict):
+            yield line_no, ValueError('Expected a JSON object')
+            continue
+        yield line_no, record
+
+
+def iter_records(stream, fmt):
+    if fmt == 'csv':
+        return iter_csv(stream)
+    if fmt == 'jsonl':
+        return iter_jsonl(stream)
+    raise ValueError('Unknown format: %s' % fmt)
+
+
+def software_values(record):
+    name = (record.get('name') or '').strip()
+    description = (record.get('description') or '').strip()
+    if not name:
+        raise ValueError('name is required')
+    if not description:
+        raise ValueError('description is required')
+    try:
+        price = float(record.get('price'))
+    except (TypeError, ValueError):
+        raise ValueError('price must be a number')
+    if price < 0:
+        raise ValueError('price must not be negative')
+    return {
+        'name': name,
+        'description': description,
+        'price': price,
+        'image_url': (record.get('image_url') or '').strip() or None,
+        'license_key': (record.get('license_key') or '').strip() or None,
+    }
+
+
+# Inserts validated rows chunk_size at a time, one executemany and one
+# transaction per chunk. If a chunk violates a constraint it is replayed row
+# by row inside savepoints so only the offending rows are rejected.
+def import_software(records, session=None, chunk_size=1000, max_errors=1000):
+    session = session or db.session
+    report = ImportReport(max_errors)
+    chunk = []
+    for line, record in records:
+        if isinstance(record, Exception):
+            report.error(line, str(record))
+            continue
+        try:
+            chunk.append((line, software_values(record)))
+        except ValueError as e:
+            report.error(line, str(e))
+            continue
+        if len(chunk) >= chunk_size:
+            _insert_chunk(session, chunk, report)
+            chunk = []
+    if chunk:
+        _insert_chunk(session, chunk, report)
+    if report.inserted:
+        invalidate_catalog()
+    return report
+
+
+def _assign_license_keys(session, rows):
+    for values, key in zip(rows, allocate_license_keys(len(rows), session)):
+        values['license_key'] = key
+
+
+# Core inserts skip the ORM flush that feeds the catalog change log
+def _record_inserted(session, rows):
+    keys = [values['license_key'] for values in rows]
+    record_changes(session, select(Software.id).where(Software.license_key.in_(keys)).order_by(Software.id))
+
+
+def _insert_chunk(session, chunk, report):
+    generated = [values for _, values in chunk if values['license_key'] is None]
+    _assign_license_keys(session, generated)
+    try:
+        session.execute(insert(Software), [values for _, values in chunk])
+        _record_inserted(session, [values for _, values in chunk])
+        session.commit()
+        report.inserted += len(chunk)
+        return
+    except IntegrityError:
+        session.rollback()
+
+    # The rollback returned the claimed keys to the pool; claim fresh ones
+    _assign_license_keys(session, generated)
+    for line, values in chunk:
+        try:
+            with session.begin_nested():
+                session.execute(insert(Software), [values])
+                _record_inserted(session, [values])
+            report.inserted += 1
+        except IntegrityError as e:
+            report.error(line, 'constraint violation: %s' % e.orig)
+    session.commit()
+
+
+# Yields plain row tuples in primary key order, fetching batch_size rows per
+# keyset query so memory use does not depend on table size.
+def iter_export_rows(kind, session=None, batch_size=1000):
+    session = session or db.session
+    model, fields = EXPORTS[kind]
+    columns = [getattr(model, field) for field in fields]
+    last_id = 0
+    while True:
+        rows = session.execute(
+            select(*columns).where(model.id > last_id).order_by(model.id).limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1][0]
+
+
+def _plain(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def export_csv(kind, session=None, batch_size=1000):
+    _, fields = EXPORTS[kind]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for row in iter_export_rows(kind, session, batch_size):
+        writer.writerow([_plain(value) for value in row])
+        if buffer.tell() >= FLUSH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_jsonl(kind, session=None, batch_size=1000):
+    _, fields = EXPORTS[kind]
+    buffer = io.StringIO()
+    for row in iter_export_rows(kind, session, batch_size):
+        buffer.write(json.dumps({field: _plain(value) for field, value in zip(fields, row)}) + '\n')
+        if buffer.tell() >= FLUSH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_rows(kind, fmt, session=None, batch_size=1000):
+    if fmt == 'csv':
+        return export_csv(kind, session, batch_size)
+    if fmt == 'jsonl':
+        return export_jsonl(kind, session, batch_size)
+    raise ValueError('Unknown format: %s' % fmt)
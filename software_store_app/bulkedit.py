@@ -0,0 +1,245 @@
+from collections import defaultdict
+
+from flask import current_app
+from flask_login import current_user, login_user
+from sqlalchemy import and_, delete, exists, func, not_, or_, select, update
+
+from software_store_app.analytics import apply_rollup_deltas, purchase_counts
+from software_store_app.catalog import invalidate_catalog
+from software_store_app.changefeed import record_changes
+from software_store_app.grid import GridError
+from software_store_app.identity import forget_user
+from software_store_app.library import note_library_changes
+from software_store_app.models import IdempotencyKey, Purchase, SalesDaily, SalesTotal, Software, User
+
+ACTIONS = ('update', 'delete')
+
+# Upper bound on an explicit id list; larger selections go through filters
+MAX_IDS = 1000
+
+
+class BulkEditError(ValueError):
+    pass
+
+
+def _coerce(column, value):
+    python_type = column.type.python_type
+    if python_type is bool:
+        return value if isinstance(value, bool) else str(value).lower() in ('1', 'true', 'yes', 'on')
+    try:
+        return python_type(value)
+    except (TypeError, ValueError):
+        raise BulkEditError('Invalid value for %s' % column.key)
+
+
+# Applies one update or delete to every row matching an editor table's
+# filters (the grid's q and equality filters), optionally narrowed to an id
+# list, as set-based statements. Rows are taken in id order, chunk_size ids
+# per statement and per transaction, so a change to a million rows never
+# holds the write lock for long; up to chunk_size rows it is all or nothing.
+# The flush hooks (rollups, library counts, change feed) do not see these
+# statements, so subclasses keep those up to date themselves.
+class BulkEdit:
+    # Columns that may be set to a value, and numeric ones that may be scaled
+    settable = ()
+    scalable = ()
+
+    def __init__(self, session, grid):
+        self.session = session
+        self.grid = grid
+        self.model = grid.model
+
+    def conditions(self, filters, ids):
+        try:
+            conditions = self.grid.conditions({name: str(value) for name, value in filters.items()})
+        except GridError as e:
+            raise BulkEditError(str(e))
+        if ids is not None:
+            if len(ids) > MAX_IDS:
+                raise BulkEditError('At most %d ids at a time; use filters instead' % MAX_IDS)
+            try:
+                conditions.append(self.model.id.in_([int(id) for id in ids]))
+            except (TypeError, ValueError):
+                raise BulkEditError('Invalid id')
+        return conditions
+
+    def values(self, set_values=None, scale=None):
+        values = {}
+        for name, value in (set_values or {}).items():
+            if name not in self.settable:
+                raise BulkEditError('%s cannot be bulk edited' % name)
+            values[name] = _coerce(getattr(self.model, name), value)
+        for name, factor in (scale or {}).items():
+            if name not in self.scalable or name in values:
+                raise BulkEditError('%s cannot be scaled' % name)
+            try:
+                factor = float(factor)
+            except (TypeError, ValueError):
+                raise BulkEditError('Invalid factor for %s' % name)
+            if factor < 0:
+                raise BulkEditError('Invalid factor for %s' % name)
+            column = getattr(self.model, name)
+            values[name] = func.round(column * factor, 2)
+        if not values:
+            raise BulkEditError('Nothing to change')
+        self.check(values)
+        return values
+
+    # Validates coerced values, e.g. that referenced rows exist
+    def check(self, values):
+        pass
+
+    # Condition for matching rows that must not be deleted, or None
+    def protected(self):
+        return None
+
+    # Returns {'action', 'matched', 'skipped', 'changed', 'chunks', 'dry_run'}.
+    # A dry run only counts: matched rows would be changed, skipped rows are
+    # protected from deletion. If a chunk fails, earlier chunks stay applied
+    # and the error propagates.
+    def run(self, action, filters=None, ids=None, set_values=None, scale=None, dry_run=False, chunk_size=None):
+        if action not in ACTIONS:
+            raise BulkEditError('Unknown action: %s' % action)
+        chunk_size = chunk_size or current_app.config['BULK_EDIT_CHUNK_SIZE']
+        conditions = self.conditions(filters or {}, ids)
+        values = self.values(set_values, scale) if action == 'update' else None
+
+        count = select(func.count()).select_from(self.model)
+        matched = self.session.scalar(count.where(*conditions))
+        skipped = 0
+        protected = self.protected() if action == 'delete' else None
+        if protected is not None:
+            skipped = self.session.scalar(count.where(*conditions, protected))
+            conditions.append(not_(protected))
+        report = {'action': action, 'matched': matched - skipped, 'skipped': skipped,
+                  'changed': 0, 'chunks': 0, 'dry_run': dry_run}
+        if dry_run or not report['matched']:
+            self.session.rollback()
+            return report
+
+        id_column = self.model.id
+        last_id = 0
+        while True:
+            ids = self.session.scalars(
+                select(id_column).where(*conditions, id_column > last_id).order_by(id_column).limit(chunk_size)
+            ).all()
+            if not ids:
+                break
+            # The filters are checked again by every statement in case a row
+            # changed since
+            where = [id_column.in_(ids)] + conditions
+            try:
+                if action == 'update':
+                    changed = self.update(where, values)
+                else:
+                    changed = self.delete(where)
+                self.session.commit()
+            except Exception:
+                self.session.rollback()
+                raise
+            self.committed(ids)
+            report['changed'] += changed
+            report['chunks'] += 1
+            last_id = ids[-1]
+        self.finished()
+        return report
+
+    # Ids of the rows a chunk changes, for statements on other tables
+    def target(self, where):
+        return select(self.model.id).where(*where)
+
+    def update(self, where, values):
+        result = self.session.execute(
+            update(self.model).where(*where).values(**values).execution_options(synchronize_session=False))
+        return result.rowcount
+
+    def delete(self, where):
+        result = self.session.execute(
+            delete(self.model).where(*where).execution_options(synchronize_session=False))
+        return result.rowcount
+
+    # After each chunk commits, with the chunk's candidate ids
+    def committed(self, ids):
+        pass
+
+    # After the last chunk
+    def finished(self):
+        pass
+
+
+class UserBulkEdit(BulkEdit):
+    settable = ('is_admin',)
+
+    # Users with purchases keep their licenses, and nobody deletes themselves
+    def protected(self):
+        has_purchases = exists().where(Purchase.user_id == User.id)
+        if current_user and current_user.is_authenticated:
+            return or_(has_purchases, User.id == current_user.id)
+        return has_purchases
+
+    # is_admin is part of the session stamp; drop cached copies and keep the
+    # editing admin logged in under the new stamp
+    def committed(self, ids):
+        for user_id in ids:
+            forget_user(user_id)
+        if current_user and current_user.is_authenticated and current_user.id in ids:
+            login_user(current_user._get_current_object())
+
+
+class SoftwareBulkEdit(BulkEdit):
+    settable = ('price',)
+    scalable = ('price',)
+
+    # Products that were sold stay for their buyers' licenses
+    def protected(self):
+        return exists().where(Purchase.software_id == Software.id)
+
+    def update(self, where, values):
+        record_changes(self.session, self.target(where))
+        return super().update(where, values)
+
+    def delete(self, where):
+        target = self.target(where)
+        record_changes(self.session, target)
+        self.session.execute(delete(SalesDaily).where(SalesDaily.software_id.in_(target)))
+        self.session.execute(delete(SalesTotal).where(SalesTotal.software_id.in_(target)))
+        return super().delete(where)
+
+    def finished(self):
+        invalidate_catalog()
+
+
+class PurchaseBulkEdit(BulkEdit):
+    settable = ('user_id', 'software_id')
+
+    def check(self, values):
+        for name, model in (('user_id', User), ('software_id', Software)):
+            if name in values and self.session.get(model, values[name]) is None:
+                raise BulkEditError('%s %d does not exist' % (name, values[name]))
+
+    # Runs before the statement, while `where` still matches the same rows
+    def _owners(self, where):
+        return self.session.scalars(select(Purchase.user_id).where(*where).distinct()).all()
+
+    def update(self, where, values):
+        if 'user_id' in values:
+            note_library_changes(self.session, self._owners(where) + [values['user_id']])
+        if 'software_id' in values:
+            # Sales move with the purchases to the new product
+            deltas = defaultdict(int)
+            for (software_id, day), count in purchase_counts(self.session, and_(*where)).items():
+                deltas[(software_id, day)] -= count
+                deltas[(values['software_id'], day)] += count
+            deltas = {key: count for key, count in deltas.items() if count}
+            if deltas:
+                apply_rollup_deltas(self.session.connection(), deltas)
+        return super().update(where, values)
+
+    def delete(self, where):
+        note_library_changes(self.session, self._owners(where))
+        counts = purchase_counts(self.session, and_(*where))
+        if counts:
+            apply_rollup_deltas(self.session.connection(), {key: -count for key, count in counts.items()})
+        # Keys point at their purchase; a replayed key then makes a new one
+        self.session.execute(delete(IdempotencyKey).where(IdempotencyKey.purchase_id.in_(self.target(where))))
+        return super().delete(where)
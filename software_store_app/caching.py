@@ -0,0 +1,174 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class BaseCache:
+    def __init__(self, default_timeout=300):
+        self.default_timeout = default_timeout
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key):
+        value = self._get(key)
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value, timeout=None):
+        timeout = self.default_timeout if timeout is None else timeout
+        # A timeout of 0 keeps the entry until it is evicted or deleted
+        expires = time.time() + timeout if timeout else None
+        self._set(key, value, expires)
+
+    def get_or_set(self, key, factory, timeout=None):
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.set(key, value, timeout)
+        return value
+
+    def stats(self):
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'backend': self.name,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else None,
+            'entries': self.size(),
+        }
+
+
+# In-process LRU cache with per-entry expiry. Entries are not shared between
+# worker processes; use FileCache when several processes must see the same
+# invalidations.
+class MemoryCache(BaseCache):
+    name = 'memory'
+
+    def __init__(self, default_timeout=300, max_entries=1024):
+        super().__init__(default_timeout)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value, expires):
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self):
+        return len(self._entries)
+
+
+# One pickle file per key under `directory`. Writes go through a temporary
+# file and os.replace() so concurrent readers never see a partial entry.
+class FileCache(BaseCache):
+    name = 'file'
+    prune_every = 100
+
+    def __init__(self, directory, default_timeout=300, max_entries=1024):
+        super().__init__(default_timeout)
+        self.directory = directory
+        self.max_entries = max_entries
+        self._sets = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.cache')
+
+    def _get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires is not None and expires <= time.time():
+            self._remove(path)
+            return None
+        return value
+
+    def _set(self, key, value, expires):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((expires, value), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            self._remove(tmp)
+            raise
+        self._sets += 1
+        if self._sets % self.prune_every == 0:
+            self._prune()
+
+    def _prune(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.cache'):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def delete(self, key):
+        self._remove(self._path(key))
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.cache'):
+                self._remove(entry.path)
+
+    def size(self):
+        return sum(1 for entry in os.scandir(self.directory) if entry.name.endswith('.cache'))
+
+
+def create_cache(config):
+    backend = config.get('CACHE_BACKEND', 'memory')
+    timeout = config.get('CACHE_DEFAULT_TIMEOUT', 300)
+    max_entries = config.get('CACHE_MAX_ENTRIES', 1024)
+    if backend == 'memory':
+        return MemoryCache(timeout, max_entries)
+    if backend == 'file':
+        return FileCache(config['CACHE_DIR'], timeout, max_entries)
+    raise ValueError('Unknown CACHE_BACKEND: %r' % backend)
@@ -0,0 +1,97 @@
+import calendar
+
+from flask import current_app
+from sqlalchemy import select
+
+from software_store_app import cache, db
+from software_store_app.models import Software
+from software_store_app.pagination import decode_cursor, encode_cursor, keyset_filter, keyset_order
+
+STATE_KEY = 'catalog:state'
+
+# Newest products first; backed by the (created_at, id) index on Software.
+CURSOR_COLUMNS = (Software.created_at, Software.id)
+
+
+def catalog_query(after=None):
+    query = select(Software).order_by(*keyset_order(Software.created_at, Software.id, descending=True))
+    if after is not None:
+        created_at, last_id = after
+        query = query.where(keyset_filter(Software.created_at, Software.id, created_at, last_id, descending=True))
+    return query
+
+
+def parse_catalog_cursor(token):
+    if not token:
+        return None
+    return decode_cursor(token, CURSOR_COLUMNS)
+
+
+def catalog_page(after=None, limit=24):
+    rows = db.session.scalars(catalog_query(after).limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1].created_at, rows[-1].id])
+    return rows, next_cursor
+
+
+# Walks the whole catalog one keyset page at a time so callers can stream
+# it without holding more than a page in memory.
+def iter_catalog_pages(after=None, limit=24):
+    while True:
+        rows, next_cursor = catalog_page(after, limit)
+        yield rows, next_cursor
+        if next_cursor is None:
+            return
+        after = [rows[-1].created_at, rows[-1].id]
+
+
+def software_to_dict(software):
+    return {
+        'id': software.id,
+        'name': software.name,
+        'description': software.description,
+        'price': software.price,
+        'image_url': software.image_url,
+        'created_at': software.created_at.isoformat() if software.created_at else None,
+    }
+
+
+# The catalog state is a version token plus a last-modified timestamp, both
+# taken from the newest entry in the catalog change log so that every worker
+# process agrees on them. Every cached page and rendered fragment is keyed by
+# the version, so a new change retires them all at once. Each process reuses
+# the state for CATALOG_STATE_TTL seconds; invalidate_catalog() drops it so
+# the process that made an edit serves it right away.
+def catalog_state():
+    state = cache.get(STATE_KEY)
+    if state is None:
+        state = _current_state()
+        cache.set(STATE_KEY, state, timeout=current_app.config['CATALOG_STATE_TTL'])
+    return state
+
+
+def invalidate_catalog():
+    cache.delete(STATE_KEY)
+
+
+def _current_state():
+    from software_store_app.changefeed import latest_change
+    change = latest_change()
+    if change is None:
+        return {'version': '0', 'last_modified': 0}
+    last_modified = calendar.timegm(change.changed_at.utctimetuple())
+    # The timestamp tells a rebuilt database's seqs from the old ones in a
+    # file cache
+    return {'version': '%d.%d' % (change.seq, last_modified), 'last_modified': last_modified}
+
+
+def cached_catalog_page(state, after=None, limit=24):
+    key = 'catalog:%s:page:%s:%d' % (state['version'], encode_cursor(after) if after else '', limit)
+
+    def load():
+        rows, next_cursor = catalog_page(after, limit)
+        return {'items': [software_to_dict(s) for s in rows], 'next_cursor': next_cursor}
+
+    return cache.get_or_set(key, load)
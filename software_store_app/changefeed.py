@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import DateTime, delete, event, insert, literal, select
+from sqlalchemy.orm import Session, aliased
+
+from software_store_app import db
+from software_store_app.catalog import software_to_dict
+from software_store_app.models import CatalogChange, Software
+
+# Every product change appends a CatalogChange row in the same transaction.
+# Clients remember the highest seq they have seen and ask for what came
+# after it: the current state of each product changed since, or a deletion
+# marker. The cost follows the number of changes, not the catalog size.
+#
+# seq is taken when the change is written, not when it commits. SQLite
+# serializes writers, so the two orders agree. Elsewhere a slow transaction
+# could commit a lower seq after a client has moved past it, so changes are
+# only published once they are CATALOG_CHANGES_SETTLE seconds old.
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_changes(session, flush_context):
+    changed = set()
+    for obj in session.new:
+        if isinstance(obj, Software):
+            changed.add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, Software) and session.is_modified(obj, include_collections=False):
+            changed.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Software):
+            changed.add(obj.id)
+    if changed:
+        now = datetime.utcnow()
+        session.connection().execute(insert(CatalogChange), [
+            {'software_id': software_id, 'changed_at': now} for software_id in sorted(changed)
+        ])
+
+
+# For writes that bypass the ORM, e.g. bulk inserts: logs a change for each
+# id returned by `software_ids`, a select of Software.id.
+def record_changes(session, software_ids):
+    now = literal(datetime.utcnow(), DateTime())
+    session.execute(insert(CatalogChange).from_select(
+        ['software_id', 'changed_at'], software_ids.add_columns(now)))
+
+
+def _settle_seconds():
+    settle = current_app.config['CATALOG_CHANGES_SETTLE']
+    if settle is None:
+        settle = 0 if db.engine.dialect.name == 'sqlite' else 5
+    return settle
+
+
+# The newest published change as (seq, changed_at), or None while the log
+# is empty. Compaction never removes it.
+def latest_change(session=None):
+    session = session or db.session
+    query = select(CatalogChange.seq, CatalogChange.changed_at)
+    settle = _settle_seconds()
+    if settle:
+        query = query.where(CatalogChange.changed_at <= datetime.utcnow() - timedelta(seconds=settle))
+    return session.execute(query.order_by(CatalogChange.seq.desc()).limit(1)).first()
+
+
+# Products changed after `since`, read as a primary key range so the cost
+# follows the page size however long the log is. A product changed several
+# times in the page is reported once; one whose later change falls on a
+# following page is reported again there. Pass the returned next_since back
+# in to continue; has_more says whether to do so right away.
+def catalog_changes(since=0, limit=100, session=None):
+    session = session or db.session
+    query = select(CatalogChange.seq, CatalogChange.software_id).where(CatalogChange.seq > since)
+    settle = _settle_seconds()
+    if settle:
+        query = query.where(CatalogChange.changed_at <= datetime.utcnow() - timedelta(seconds=settle))
+    rows = session.execute(query.order_by(CatalogChange.seq).limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    latest = {}
+    for seq, software_id in rows:
+        latest[software_id] = seq
+    software = {}
+    if latest:
+        software = {s.id: s for s in session.scalars(select(Software).where(Software.id.in_(latest)))}
+    changes = []
+    for software_id, seq in sorted(latest.items(), key=lambda item: item[1]):
+        current = software.get(software_id)
+        changes.append({
+            'seq': seq,
+            'software_id': software_id,
+            'op': 'upsert' if current is not None else 'delete',
+            'software': software_to_dict(current) if current is not None else None,
+        })
+    return {
+        'changes': changes,
+        'next_since': rows[-1].seq if rows else since,
+        'has_more': has_more,
+    }
+
+
+# Deletes every change that has a newer one for the same product. The feed
+# only ever reports the newest, so clients cannot tell the difference.
+# Works through the log in seq order, batch_size rows per transaction.
+def compact_changes(session=None, batch_size=1000):
+    session = session or db.session
+    newer = aliased(CatalogChange)
+    superseded = select(newer.seq).where(
+        newer.software_id == CatalogChange.software_id, newer.seq > CatalogChange.seq).exists()
+    deleted = 0
+    last_seq = 0
+    while True:
+        seqs = session.scalars(
+            select(CatalogChange.seq)
+            .where(CatalogChange.seq > last_seq, superseded)
+            .order_by(CatalogChange.seq)
+            .limit(batch_size)
+        ).all()
+        if not seqs:
+            return deleted
+        session.execute(delete(CatalogChange).where(CatalogChange.seq.in_(seqs)))
+        session.commit()
+        deleted += len(seqs)
+        last_seq = seqs[-1]
@@ -0,0 +1,230 @@
+import sys
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from software_store_app import db
+from software_store_app.analytics import rebuild_rollups
+from software_store_app.assets import Image, build_assets, fetch_vendor_assets, generate_thumbnails
+from software_store_app.changefeed import compact_changes
+from software_store_app.database import create_schema
+from software_store_app.jobs import job_counts, purge_jobs
+from software_store_app.licensing import pool_status, refill_pool
+from software_store_app.mailsink import MailSink
+from software_store_app.migrations import applied_versions, load_migrations, pending_migrations, stamp, upgrade
+from software_store_app.models import Software
+from software_store_app.queryplan import explain_hot_queries
+from software_store_app.bulk import EXPORTS, FORMATS, detect_format, export_rows, import_software, iter_records
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create missing tables and the search index, and apply migrations."""
+    create_schema(db, echo=click.echo)
+    click.echo('Database initialized.')
+
+
+@click.group('db')
+def db_group():
+    """Inspect and apply schema migrations."""
+
+
+@db_group.command('status')
+@with_appcontext
+def db_status_command():
+    """List migrations and whether each has been applied."""
+    applied = applied_versions(db.engine)
+    for migration in load_migrations():
+        click.echo('%s %04d %s' % ('applied' if migration.version in applied else 'pending',
+                                   migration.version, migration.description))
+
+
+@db_group.command('upgrade')
+@click.option('--to', 'target', type=int, help='Stop after this version.')
+@click.option('--dry-run', is_flag=True, help='Only list the migrations that would run.')
+@with_appcontext
+def db_upgrade_command(target, dry_run):
+    """Apply pending migrations in order."""
+    if dry_run:
+        for migration in pending_migrations(db.engine, target):
+            click.echo('%04d %s' % (migration.version, migration.description))
+        return
+    applied = upgrade(db.engine, target, echo=click.echo)
+    click.echo('Applied %d migrations.' % len(applied))
+
+
+@db_group.command('stamp')
+@click.option('--to', 'target', type=int, help='Stop after this version.')
+@with_appcontext
+def db_stamp_command(target):
+    """Mark migrations as applied without running them."""
+    stamped = stamp(db.engine, target)
+    click.echo('Marked %d migrations as applied.' % len(stamped))
+
+
+@click.command('explain')
+@click.option('--query', 'names', multiple=True, help='Only this hot query; repeatable.')
+@click.option('--verbose', is_flag=True, help='Also print the SQL of each statement.')
+@with_appcontext
+def explain_command(names, verbose):
+    """Show the query plans of the hot queries and flag full table scans."""
+    flagged = 0
+    name = None
+    for result in explain_hot_queries(names):
+        if result['name'] != name:
+            name = result['name']
+            click.echo(name)
+        scans = result['scans']
+        if verbose or scans:
+            click.echo('  ' + ' '.join(result['statement'].split()))
+        if scans:
+            click.echo('  FULL SCAN: %s' % ', '.join(scans))
+        for line in result['plan']:
+            click.echo('    ' + line)
+        flagged += bool(scans)
+    if flagged:
+        click.echo('%d statements scan whole tables.' % flagged, err=True)
+        sys.exit(1)
+
+
+@click.command('import-catalog')
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults to the file extension.')
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows per insert batch and transaction.')
+@with_appcontext
+def import_catalog_command(source, fmt, chunk_size):
+    """Bulk import software from a CSV or JSON Lines file ('-' for stdin)."""
+    fmt = fmt or detect_format(source.name)
+    report = import_software(iter_records(source, fmt), chunk_size=chunk_size)
+    for error in report.errors:
+        click.echo('line %(line)s: %(error)s' % error, err=True)
+    click.echo('Imported %d rows, %d failed.' % (report.inserted, report.error_count))
+    if report.error_count:
+        sys.exit(1)
+
+
+@click.command('export-data')
+@click.argument('kind', type=click.Choice(sorted(EXPORTS)))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default='csv', show_default=True)
+@click.option('--output', type=click.File('w', encoding='utf-8'), default='-', help='Defaults to stdout.')
+@with_appcontext
+def export_data_command(kind, fmt, output):
+    """Stream software or purchases to CSV or JSON Lines."""
+    for chunk in export_rows(kind, fmt):
+        output.write(chunk)
+
+
+@click.command('refill-license-pool')
+@click.option('--size', type=int, help='Keys to add; defaults to LICENSE_POOL_BATCH.')
+@with_appcontext
+def refill_license_pool_command(size):
+    """Pre-generate license keys so purchases never wait for a refill."""
+    added = refill_pool(size=size)
+    db.session.commit()
+    status = pool_status()
+    click.echo('Added %d keys; %d free, %d issued.' % (added, status['free'], status['issued']))
+
+
+@click.command('rebuild-sales-rollups')
+@with_appcontext
+def rebuild_sales_rollups_command():
+    """Recompute the sales rollup tables from the purchase history."""
+    products = rebuild_rollups()
+    db.session.commit()
+    click.echo('Rebuilt sales rollups for %d products.' % products)
+
+
+@click.command('run-jobs')
+@click.option('--workers', type=int, help='Defaults to JOBS_WORKERS.')
+@click.option('--drain', is_flag=True, help='Run the jobs that are due now and exit.')
+@with_appcontext
+def run_jobs_command(workers, drain):
+    """Process background jobs (emails) outside the web processes."""
+    queue = current_app.extensions['jobs']
+    if drain:
+        done = queue.drain()
+        click.echo('Ran %d jobs; %s' % (done, job_counts()))
+        return
+    queue.workers = workers or queue.workers or 1
+    queue.start()
+    click.echo('Running %d job workers, press CTRL+C to quit.' % queue.workers)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        queue.stop()
+
+
+@click.command('purge-jobs')
+@click.option('--days', default=7, show_default=True, help='Delete finished jobs older than this.')
+@with_appcontext
+def purge_jobs_command(days):
+    """Delete old finished jobs from the outbox."""
+    deleted = purge_jobs(days)
+    db.session.commit()
+    click.echo('Deleted %d jobs.' % deleted)
+
+
+@click.command('compact-catalog-changes')
+@click.option('--batch-size', default=1000, show_default=True)
+@with_appcontext
+def compact_catalog_changes_command(batch_size):
+    """Drop catalog change log entries superseded by a newer one."""
+    deleted = compact_changes(batch_size=batch_size)
+    click.echo('Deleted %d catalog changes.' % deleted)
+
+
+@click.command('mail-sink')
+@click.option('--host', default='localhost', show_default=True)
+@click.option('--port', default=1025, show_default=True)
+@click.option('--output-dir', type=click.Path(file_okay=False), help='Save messages as .eml files instead of printing them.')
+def mail_sink_command(host, port, output_dir):
+    """Run a local SMTP server that accepts and shows all outgoing mail."""
+    server = MailSink((host, port), output_dir, echo=click.echo)
+    click.echo('Mail sink listening on %s:%d; set MAIL_PORT=%d.' % (host, port, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+@click.command('build-assets')
+@click.option('--fetch-vendor', is_flag=True, help='Download Bootstrap into static/vendor first.')
+@with_appcontext
+def build_assets_command(fetch_vendor):
+    """Fingerprint and pre-compress static files for far-future caching."""
+    if fetch_vendor:
+        fetch_vendor_assets(current_app.static_folder)
+    manifest = build_assets(current_app.static_folder, current_app.config['ASSETS_DIR'])
+    click.echo('Built %d assets into %s; restart the app to use them.' % (
+        len(manifest), current_app.config['ASSETS_DIR']))
+
+
+@click.command('build-thumbnails')
+@with_appcontext
+def build_thumbnails_command():
+    """Download and resize every product image into the thumbnail cache."""
+    if Image is None:
+        raise click.ClickException('Pillow is not installed.')
+    built = failed = 0
+    for software in Software.query.filter(Software.image_url.isnot(None)).yield_per(500):
+        if not software.image_url.startswith(('http://', 'https://')):
+            continue
+        try:
+            generate_thumbnails(software.image_url)
+            built += 1
+        except Exception as e:
+            failed += 1
+            click.echo('%s: %s' % (software.image_url, e), err=True)
+    click.echo('Thumbnails ready for %d products, %d failed.' % (built, failed))
+
+
+def register_commands(app):
+    for command in (init_db_command, db_group, explain_command, import_catalog_command, export_data_command,
+                    refill_license_pool_command, rebuild_sales_rollups_command, run_jobs_command,
+                    purge_jobs_command, compact_catalog_changes_command, mail_sink_command, build_assets_command,
+                    build_thumbnails_command):
+        app.cli.add_command(command)
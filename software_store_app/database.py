@@ -0,0 +1,68 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+def is_sqlite(uri):
+    return make_url(uri).get_backend_name() == 'sqlite'
+
+
+# Engine keyword arguments for the configured backend. SQLite uses
+# SQLAlchemy's default per-thread pool; server databases get a real
+# connection pool sized from the DB_POOL_* settings.
+def engine_options(config):
+    if is_sqlite(config['SQLALCHEMY_DATABASE_URI']):
+        return {'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000.0}}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+
+# WAL lets readers proceed while a purchase is being written; NORMAL
+# synchronous is durable across application crashes in WAL mode and saves an
+# fsync per commit; busy_timeout makes writers queue instead of failing.
+def install_sqlite_pragmas(engine, config):
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=%s' % config['SQLITE_JOURNAL_MODE'])
+        cursor.execute('PRAGMA synchronous=%s' % config['SQLITE_SYNCHRONOUS'])
+        cursor.execute('PRAGMA busy_timeout=%d' % config['SQLITE_BUSY_TIMEOUT'])
+        cursor.close()
+
+
+def init_database(app, db):
+    options = engine_options(app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    db.init_app(app)
+    if is_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+        with app.app_context():
+            install_sqlite_pragmas(db.engine, app.config)
+
+
+# Creates missing tables and the search index and applies pending
+# migrations. Run by `flask init-db`, never at import or app creation time.
+def create_schema(db, echo=None):
+    from sqlalchemy import inspect
+    from software_store_app import models
+    from software_store_app.analytics import rebuild_rollups
+    from software_store_app.migrations import stamp, upgrade
+    from software_store_app.search import install_search
+    tables = inspect(db.engine).get_table_names()
+    # Rollup tables added to a database that already has purchases start
+    # out filled from the history
+    new_rollups = 'sales_total' not in tables
+    db.create_all()
+    install_search(db.engine)
+    if new_rollups:
+        rebuild_rollups(db.session)
+        db.session.commit()
+    if tables:
+        upgrade(db.engine, echo=echo)
+    else:
+        # create_all() built the current schema; nothing to migrate
+        stamp(db.engine)
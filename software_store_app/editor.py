@@ -1,105 +1,144 @@
-import os
-import sys
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, abort, current_app
+from flask_login import login_user, login_required, logout_user, current_user
+from software_store_app import db
+from software_store_app.assets import enqueue_thumbnails
+from software_store_app.bulkedit import BulkEditError, PurchaseBulkEdit, SoftwareBulkEdit, UserBulkEdit
+from software_store_app.catalog import invalidate_catalog
+from software_store_app.grid import Grid, GridError
+from software_store_app.identity import forget_user
+from software_store_app.licensing import allocate_license_key
+from software_store_app.models import User, Software, Purchase
+from software_store_app.notifications import enqueue_welcome_email
+from software_store_app.reads import editor_reads
+from software_store_app.security import hash_password, limit_auth_attempt, needs_rehash, verify_password
 
-# Add the project root directory to Python path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+editor = Blueprint('editor', __name__, url_prefix='/editor')
 
-from flask import Flask, render_template, request, redirect, url_for, flash
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from software_store_app import models
-import string
-import random
+def _serialize_purchase(purchase):
+    return {
+        'id': purchase.id,
+        'user_id': purchase.user_id,
+        'username': purchase.user.username if purchase.user else None,
+        'software_id': purchase.software_id,
+        'software_name': purchase.software.name if purchase.software else None,
+        'license_key': purchase.license_key,
+        'purchase_date': purchase.purchase_date.isoformat() if purchase.purchase_date else None,
+    }
 
-# Create Flask app
-editor_app = Flask(__name__)
-editor_app.config['SECRET_KEY'] = 'aghrghealvn3451'
-editor_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///software_store.db'
-editor_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Data sources for the editor dashboard tables, read through EDITOR_READS
+grids = {
+    'users': Grid(
+        editor_reads, User,
+        columns=('id', 'username', 'email', 'is_admin'),
+        search=('username', 'email'),
+        filters=('is_admin',),
+    ),
+    'software': Grid(
+        editor_reads, Software,
+        columns=('id', 'name', 'price', 'created_at'),
+        search=('name',),
+        serialize=lambda s: {
+            'id': s.id,
+            'name': s.name,
+            'price': s.price,
+            'created_at': s.created_at.isoformat() if s.created_at else None,
+        },
+    ),
+    'purchases': Grid(
+        editor_reads, Purchase,
+        columns=('id', 'purchase_date', 'user_id', 'software_id'),
+        search=('license_key',),
+        filters=('user_id', 'software_id'),
+        joined=('user', 'software'),
+        serialize=_serialize_purchase,
+    ),
+}
 
-# Initialize Flask-Login
-login_manager = LoginManager()
-login_manager.init_app(editor_app)
-login_manager.login_view = 'editor_login'
+# Set-based edits of the same tables; writes always go to the primary
+bulk_edits = {
+    'users': UserBulkEdit(db.session, grids['users']),
+    'software': SoftwareBulkEdit(db.session, grids['software']),
+    'purchases': PurchaseBulkEdit(db.session, grids['purchases']),
+}
 
-# Initialize SQLAlchemy as a standalone instance
-editor_db = SQLAlchemy()
+def invalidate_grid_counts():
+    for grid in grids.values():
+        grid.clear_counts()
 
-# Initialize the database with the app
-editor_db.init_app(editor_app)
-
-# Create models using our local database instance
-class LocalUser(editor_db.Model, UserMixin):
-    __tablename__ = 'user'
-    id = editor_db.Column(editor_db.Integer, primary_key=True)
-    username = editor_db.Column(editor_db.String(80), unique=True, nullable=False)
-    email = editor_db.Column(editor_db.String(120), unique=True, nullable=False)
-    password_hash = editor_db.Column(editor_db.String(128))
-    is_admin = editor_db.Column(editor_db.Boolean, default=False)
-    purchases = editor_db.relationship('LocalPurchase', backref='user', lazy=True)
-
-class LocalSoftware(editor_db.Model):
-    __tablename__ = 'software'
-    id = editor_db.Column(editor_db.Integer, primary_key=True)
-    name = editor_db.Column(editor_db.String(100), nullable=False)
-    description = editor_db.Column(editor_db.Text, nullable=False)
-    price = editor_db.Column(editor_db.Float, nullable=False)
-    image_url = editor_db.Column(editor_db.String(200))
-    license_key = editor_db.Column(editor_db.String(100), unique=True, nullable=False)
-    created_at = editor_db.Column(editor_db.DateTime, default=models.datetime.utcnow)
-    purchases = editor_db.relationship('LocalPurchase', backref='software', lazy=True)
-
-class LocalPurchase(editor_db.Model):
-    __tablename__ = 'purchase'
-    id = editor_db.Column(editor_db.Integer, primary_key=True)
-    user_id = editor_db.Column(editor_db.Integer, editor_db.ForeignKey('user.id'), nullable=False)
-    software_id = editor_db.Column(editor_db.Integer, editor_db.ForeignKey('software.id'), nullable=False)
-    purchase_date = editor_db.Column(editor_db.DateTime, default=editor_db.func.current_timestamp())
-    license_key = editor_db.Column(editor_db.String(100), nullable=False)
-
-# Function to generate unique license key
-def generate_license_key():
-    chars = string.ascii_uppercase + string.digits
-    return ''.join(random.choice(chars) for _ in range(20))
-
-# Initialize the database
-with editor_app.app_context():
-    editor_db.create_all()
+# The editor is for admins only. Everyone else gets no further than its
+# login page; anonymous visitors are sent there.
+@editor.before_request
+def _require_admin():
+    if request.endpoint in ('editor.login', 'editor.logout'):
+        return None
+    if not current_user.is_authenticated:
+        return current_app.login_manager.unauthorized()
+    if not current_user.is_admin:
+        abort(403)
 
-# User loader for Flask-Login
-@login_manager.user_loader
-def load_user(user_id):
-    return LocalUser.query.get(int(user_id))
+# A successful form post changed the primary; let a snapshot catch up
+@editor.after_request
+def _refresh_reads(response):
+    if request.method == 'POST' and response.status_code < 400:
+        current_app.extensions['editor_reads'].changed()
+    return response
 
-# Make the Flask app instance available for import
-app = editor_app
+@editor.route('/')
+@login_required
+def index():
+    return render_template('editor/editor.html', reads=current_app.extensions['editor_reads'].status())
 
-# Export our local models for use in routes
-User = LocalUser
-Software = LocalSoftware
-Purchase = LocalPurchase
+@editor.route('/api/<table>')
+@login_required
+def grid_api(table):
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied'}), 403
+    grid = grids.get(table)
+    if grid is None:
+        abort(404)
+    try:
+        page = grid.page(request.args)
+    except GridError as e:
+        return jsonify({'error': str(e)}), 400
+    page['as_of'] = current_app.extensions['editor_reads'].status()['as_of']
+    return jsonify(page)
 
-@app.route('/')
+# Updates or deletes every row matching the table's filters, or the listed
+# ids among them: {"action": "update" | "delete", "filters": {"q": ...},
+# "ids": [...], "set": {column: value}, "scale": {column: factor},
+# "dry_run": true}. A dry run returns the row counts without changing
+# anything.
+@editor.route('/api/<table>/bulk', methods=['POST'])
 @login_required
-def editor():
-    users = User.query.all()
-    software = Software.query.all()
-    purchases = Purchase.query.all()
-    return render_template('editor/editor.html', 
-                         users=users, 
-                         software=software, 
-                         purchases=purchases)
+def bulk_api(table):
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied'}), 403
+    bulk = bulk_edits.get(table)
+    if bulk is None:
+        abort(404)
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) \
+            or not all(isinstance(data.get(name) or {}, dict) for name in ('filters', 'set', 'scale')) \
+            or not isinstance(data.get('ids') or [], list):
+        return jsonify({'error': 'Malformed request'}), 400
+    try:
+        report = bulk.run(data.get('action'), data.get('filters'), data.get('ids'),
+                          data.get('set'), data.get('scale'), bool(data.get('dry_run')))
+    except BulkEditError as e:
+        return jsonify({'error': str(e)}), 400
+    if report['changed']:
+        invalidate_grid_counts()
+    return jsonify(report)
 
-@app.route('/editor/index')
+@editor.route('/index')
 @login_required
-def editor_index():
-    return redirect(url_for('editor'))
+def legacy_index():
+    return redirect(url_for('.index'))
 
-@app.route('/editor/login', methods=['GET', 'POST'])
-def editor_login():
-    if current_user.is_authenticated:
-        return redirect(url_for('editor'))
+@editor.route('/login', methods=['GET', 'POST'])
+def login():
+    if current_user.is_authenticated and current_user.is_admin:
+        return redirect(url_for('.index'))
     
     if request.method == 'POST':
         email = request.form.get('email')
@@ -107,22 +146,28 @@ def editor_login():
         
         if not email or not password:
             flash('Please fill in all fields')
-            return redirect(url_for('editor_login'))
+            return redirect(url_for('.login'))
             
+        limit_auth_attempt(request.remote_addr, email)
         user = User.query.filter_by(email=email).first()
-        if user and check_password_hash(user.password_hash, password):
+        if user and verify_password(user.password_hash, password):
+            if not user.is_admin:
+                flash('Access denied. Admin privileges required.')
+                return redirect(url_for('.login'))
+            if needs_rehash(user.password_hash):
+                user.password_hash = hash_password(password)
+                db.session.commit()
             login_user(user)
             next_page = request.args.get('next')
-            return redirect(next_page if next_page else url_for('editor'))
+            return redirect(next_page if next_page else url_for('.index'))
         
         flash('Invalid email or password')
     return render_template('editor/login.html')
 
-@app.route('/editor/register', methods=['GET', 'POST'])
-def editor_register():
-    if current_user.is_authenticated:
-        return redirect(url_for('editor'))
-    
+# Admins add accounts here; customers register on the storefront
+@editor.route('/register', methods=['GET', 'POST'])
+@login_required
+def register():
     if request.method == 'POST':
         username = request.form.get('username')
         email = request.form.get('email')
@@ -131,58 +176,64 @@ def editor_register():
         
         if not all([username, email, password, confirm_password]):
             flash('Please fill in all fields')
-            return redirect(url_for('editor_register'))
+            return redirect(url_for('.register'))
             
+        limit_auth_attempt(request.remote_addr)
+
         if password != confirm_password:
             flash('Passwords do not match')
-            return redirect(url_for('editor_register'))
+            return redirect(url_for('.register'))
             
         if User.query.filter_by(email=email).first():
             flash('Email already exists')
-            return redirect(url_for('editor_register'))
+            return redirect(url_for('.register'))
             
         if User.query.filter_by(username=username).first():
             flash('Username already exists')
-            return redirect(url_for('editor_register'))
+            return redirect(url_for('.register'))
             
         new_user = User(
             username=username,
             email=email,
-            password_hash=generate_password_hash(password),
+            password_hash=hash_password(password),
             is_admin=False
         )
-        editor_db.session.add(new_user)
+        db.session.add(new_user)
         try:
-            editor_db.session.commit()
-            flash('Registration successful! Please log in.')
-            return redirect(url_for('editor_login'))
+            db.session.flush()
+            enqueue_welcome_email(new_user)
+            db.session.commit()
+            invalidate_grid_counts()
+            flash('User created successfully')
+            return redirect(url_for('.index'))
         except Exception as e:
-            editor_db.session.rollback()
+            db.session.rollback()
             flash('An error occurred during registration')
-            return redirect(url_for('editor_register'))
+            return redirect(url_for('.register'))
     return render_template('editor/register.html')
 
-@app.route('/editor/logout')
+@editor.route('/logout')
 @login_required
-def editor_logout():
+def logout():
+    forget_user(current_user.id)
     logout_user()
     flash('You have been logged out.')
-    return redirect(url_for('editor_login'))
+    return redirect(url_for('.login'))
 
-@app.route('/editor/admin')
+@editor.route('/admin')
 @login_required
-def editor_admin():
+def admin():
     if not current_user.is_admin:
         flash('Access denied. Admin privileges required.')
-        return redirect(url_for('editor'))
+        return redirect(url_for('.index'))
     return render_template('editor/admin.html')
 
-@app.route('/editor/add_software', methods=['GET', 'POST'])
+@editor.route('/add_software', methods=['GET', 'POST'])
 @login_required
 def add_software():
     if not current_user.is_admin:
         flash('Access denied. Admin privileges required.')
-        return redirect(url_for('editor'))
+        return redirect(url_for('.index'))
     
     if request.method == 'POST':
         name = request.form.get('name')
@@ -192,47 +243,51 @@ def add_software():
         
         if not all([name, description, price]):
             flash('Please fill in all required fields')
-            return redirect(url_for('add_software'))
+            return redirect(url_for('.add_software'))
             
         new_software = Software(
             name=name,
             description=description,
             price=price,
             image_url=image_url,
-            license_key=generate_license_key()
+            license_key=allocate_license_key(db.session)
         )
         
         try:
-            editor_db.session.add(new_software)
-            editor_db.session.commit()
+            db.session.add(new_software)
+            db.session.flush()
+            enqueue_thumbnails(new_software)
+            db.session.commit()
+            invalidate_grid_counts()
+            invalidate_catalog()
             flash('Software added successfully')
-            return redirect(url_for('editor'))
+            return redirect(url_for('.index'))
         except Exception as e:
-            editor_db.session.rollback()
+            db.session.rollback()
             flash('Error adding software')
-            return redirect(url_for('add_software'))
+            return redirect(url_for('.add_software'))
     
     return render_template('editor/add_software.html')
 
-@app.route('/editor/edit_user/<int:user_id>')
+@editor.route('/edit_user/<int:user_id>')
 @login_required
-def editor_edit_user(user_id):
+def show_user(user_id):
     user = User.query.get_or_404(user_id)
     return render_template('editor/edit_user.html', user=user)
 
-@app.route('/editor/edit_software/<int:software_id>')
+@editor.route('/edit_software/<int:software_id>')
 @login_required
-def editor_edit_software(software_id):
+def show_software(software_id):
     software = Software.query.get_or_404(software_id)
     return render_template('editor/edit_software.html', software=software)
 
-@app.route('/editor/edit_purchase/<int:purchase_id>')
+@editor.route('/edit_purchase/<int:purchase_id>')
 @login_required
-def editor_edit_purchase(purchase_id):
+def show_purchase(purchase_id):
     purchase = Purchase.query.get_or_404(purchase_id)
     return render_template('editor/edit_purchase.html', purchase=purchase)
 
-@app.route('/user/<int:user_id>/edit', methods=['GET', 'POST'])
+@editor.route('/user/<int:user_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_user(user_id):
     user = User.query.get_or_404(user_id)
@@ -241,15 +296,20 @@ def edit_user(user_id):
         user.username = request.form.get('username', user.username)
         user.email = request.form.get('email', user.email)
         if request.form.get('password'):
-            user.password_hash = generate_password_hash(request.form.get('password'))
+            user.password_hash = hash_password(request.form.get('password'))
         user.is_admin = bool(request.form.get('is_admin'))
-        editor_db.session.commit()
+        db.session.commit()
+        forget_user(user.id)
+        if user.id == current_user.id:
+            # Keep the editing admin logged in under the new stamp
+            login_user(user)
+        invalidate_grid_counts()
         flash('User updated successfully')
-        return redirect(url_for('editor'))
+        return redirect(url_for('.index'))
     
     return render_template('editor/edit_user.html', user=user)
 
-@app.route('/software/<int:software_id>/edit', methods=['GET', 'POST'])
+@editor.route('/software/<int:software_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_software(software_id):
     software = Software.query.get_or_404(software_id)
@@ -260,14 +320,17 @@ def edit_software(software_id):
         software.price = float(request.form.get('price', software.price))
         software.image_url = request.form.get('image_url', software.image_url)
         if not software.license_key:
-            software.license_key = generate_license_key()
-        editor_db.session.commit()
+            software.license_key = allocate_license_key(db.session)
+        enqueue_thumbnails(software)
+        db.session.commit()
+        invalidate_grid_counts()
+        invalidate_catalog()
         flash('Software updated successfully')
-        return redirect(url_for('editor'))
+        return redirect(url_for('.index'))
     
     return render_template('editor/edit_software.html', software=software)
 
-@app.route('/purchase/<int:purchase_id>/edit', methods=['GET', 'POST'])
+@editor.route('/purchase/<int:purchase_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_purchase(purchase_id):
     purchase = Purchase.query.get_or_404(purchase_id)
@@ -276,11 +339,9 @@ def edit_purchase(purchase_id):
         purchase.user_id = request.form.get('user_id', purchase.user_id)
         purchase.software_id = request.form.get('software_id', purchase.software_id)
         purchase.license_key = request.form.get('license_key', purchase.license_key)
-        editor_db.session.commit()
+        db.session.commit()
+        invalidate_grid_counts()
         flash('Purchase updated successfully')
-        return redirect(url_for('editor'))
+        return redirect(url_for('.index'))
     
     return render_template('editor/edit_purchase.html', purchase=purchase)
-
-if __name__ == '__main__':
-    app.run(debug=True, port=5001)
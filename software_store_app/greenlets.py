@@ -0,0 +1,39 @@
+import asyncio
+import time
+
+from sqlalchemy.util.concurrency import await_only, in_greenlet
+
+try:
+    import greenlet
+except ImportError:
+    greenlet = None
+
+# Under the ASGI server (asgi.py) storefront views run inside the greenlets
+# SQLAlchemy's asyncio extension uses to run sync code on the event loop. A
+# blocking wait there would stall every request on the loop, so these hand
+# the wait to the loop instead; in ordinary threads they block as usual.
+
+
+def _on_loop():
+    return greenlet is not None and in_greenlet()
+
+
+def sleep(seconds):
+    if _on_loop():
+        await_only(asyncio.sleep(seconds))
+    else:
+        time.sleep(seconds)
+
+
+def wait(future):
+    if _on_loop():
+        return await_only(asyncio.wrap_future(future))
+    return future.result()
+
+
+# Runs a blocking call, e.g. a lock acquire with a timeout, on a worker
+# thread when on the event loop.
+def run_blocking(fn, *args):
+    if _on_loop():
+        return await_only(asyncio.to_thread(fn, *args))
+    return fn(*args)
@@ -0,0 +1,112 @@
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import joinedload
+
+from software_store_app.pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_filter, keyset_order
+
+
+class GridError(ValueError):
+    pass
+
+
+# Server-side data source for one editor table: keyset pagination over a
+# whitelisted sort column, equality filters, a substring search and a
+# total row count that is cached for GRID_COUNT_TTL seconds per filter set.
+class Grid:
+    def __init__(self, session, model, columns, search=(), filters=(), joined=(), serialize=None):
+        self.session = session
+        self.model = model
+        self.columns = {name: getattr(model, name) for name in columns}
+        self.search = [getattr(model, name) for name in search]
+        self.filters = {name: getattr(model, name) for name in filters}
+        self.joined = joined
+        self.serialize = serialize or (lambda row: {name: getattr(row, name) for name in self.columns})
+        self._lock = threading.Lock()
+
+    def page(self, args):
+        limit = args.get('limit', type=int) or current_app.config['GRID_PAGE_SIZE']
+        limit = max(1, min(limit, current_app.config['GRID_MAX_PAGE_SIZE']))
+
+        sort = args.get('sort', 'id')
+        descending = sort.startswith('-')
+        column = self.columns.get(sort.lstrip('-'))
+        if column is None:
+            raise GridError('Unknown sort column: %s' % sort.lstrip('-'))
+        id_column = self.model.id
+
+        conditions = self.conditions(args)
+        query = select(self.model).where(*conditions).order_by(*keyset_order(column, id_column, descending))
+        if self.joined:
+            query = query.options(*[joinedload(getattr(self.model, name)) for name in self.joined])
+
+        token = args.get('cursor')
+        if token:
+            try:
+                value, last_id = decode_cursor(token, (column, id_column))
+            except InvalidCursor:
+                raise GridError('Malformed cursor')
+            query = query.where(keyset_filter(column, id_column, value, last_id, descending))
+
+        rows = self.session.scalars(query.limit(limit + 1)).unique().all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor([getattr(last, column.key), last.id])
+
+        return {
+            'items': [self.serialize(row) for row in rows],
+            'next_cursor': next_cursor,
+            'total': self.count(conditions, args),
+            'sort': sort,
+        }
+
+    def conditions(self, args):
+        conditions = []
+        for name, column in self.filters.items():
+            raw = args.get(name)
+            if raw in (None, ''):
+                continue
+            try:
+                if column.type.python_type is bool:
+                    value = raw.lower() in ('1', 'true', 'yes', 'on')
+                else:
+                    value = column.type.python_type(raw)
+            except (TypeError, ValueError):
+                raise GridError('Invalid value for %s' % name)
+            conditions.append(column == value)
+
+        q = args.get('q', '').strip()
+        if q and self.search:
+            pattern = '%%%s%%' % q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            conditions.append(or_(*[column.like(pattern, escape='\\') for column in self.search]))
+        return conditions
+
+    # Cached totals belong to the app, whose database they count; the Grid
+    # itself is shared by every app the factory builds
+    def _counts(self):
+        return current_app.extensions.setdefault('grid_counts', {}).setdefault(self.model.__tablename__, {})
+
+    def count(self, conditions, args):
+        key = (args.get('q', '').strip(),) + tuple(args.get(name, '') for name in self.filters)
+        ttl = current_app.config['GRID_COUNT_TTL']
+        now = time.monotonic()
+        counts = self._counts()
+        with self._lock:
+            cached = counts.get(key)
+            if cached and cached[1] > now:
+                return cached[0]
+
+        total = self.session.scalar(select(func.count()).select_from(self.model).where(*conditions))
+        with self._lock:
+            if len(counts) >= 1024:
+                counts.clear()
+            counts[key] = (total, now + ttl)
+        return total
+
+    def clear_counts(self):
+        with self._lock:
+            self._counts().clear()
@@ -0,0 +1,60 @@
+from flask import current_app
+from sqlalchemy.orm import make_transient_to_detached
+
+from software_store_app import db, login_manager
+from software_store_app.caching import MemoryCache
+from software_store_app.models import User
+from software_store_app.security import session_stamp
+
+# Per-process cache of logged-in users so authenticated requests do not start
+# with a SELECT. Sessions hold '<id>:<stamp>' (User.get_id) and a session
+# whose stamp no longer matches the database is logged out, but a cached user
+# is trusted while its stamp matches the session's. forget_user() only clears
+# the current process, so after a password change another process keeps
+# accepting the old session for up to USER_CACHE_TIMEOUT seconds, and other
+# edits (username, email) take as long to show there. Admins are never
+# served from the cache: a demoted admin loses access on the next request.
+
+COLUMNS = [attr.key for attr in User.__mapper__.column_attrs]
+
+
+def _user_cache():
+    return current_app.extensions['user_cache']
+
+
+@login_manager.user_loader
+def load_user(session_id):
+    user_id, _, stamp = session_id.partition(':')
+    # Sessions from before stamps were introduced log in again
+    if not user_id.isdigit() or not stamp:
+        return None
+    cache = _user_cache()
+    if cache is not None:
+        cached = cache.get(user_id)
+        if cached is not None and cached[0] == stamp and not cached[1]['is_admin']:
+            return _attach(cached[1])
+    user = db.session.get(User, int(user_id))
+    if user is None or session_stamp(user) != stamp:
+        return None
+    if cache is not None:
+        cache.set(user_id, (stamp, {key: getattr(user, key) for key in COLUMNS}))
+    return user
+
+
+# Rebuilds the user in the request's session without querying; relationships
+# such as user.purchases still load lazily.
+def _attach(values):
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def forget_user(user_id):
+    cache = _user_cache()
+    if cache is not None:
+        cache.delete(str(user_id))
+
+
+def init_identity(app):
+    timeout = app.config['USER_CACHE_TIMEOUT']
+    app.extensions['user_cache'] = MemoryCache(timeout, app.config['USER_CACHE_MAX_ENTRIES']) if timeout else None
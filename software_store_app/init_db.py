@@ -4,9 +4,12 @@ import sys
 # Add the project root to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from software_store_app import app, db
+from software_store_app import create_app, db
+from software_store_app.database import create_schema
+
+app = create_app()
 
 with app.app_context():
     print("Initializing database...")
-    db.create_all()
+    create_schema(db)
     print("Database initialized successfully!")
@@ -0,0 +1,214 @@
+import atexit
+import json
+import logging
+import random
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import and_, event, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from software_store_app import db
+from software_store_app.models import Job
+
+log = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+# Jobs fetched per claim attempt; workers pick among them at random so they
+# rarely race for the same row.
+CLAIM_CANDIDATES = 8
+
+# Set after a commit that enqueued jobs so idle workers start at once
+# instead of waiting for their next poll.
+_wakeup = threading.Event()
+
+
+def job(kind):
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+# Adds a job to the caller's transaction: it is only visible to workers once
+# the caller commits, and disappears if the caller rolls back.
+def enqueue(kind, payload=None, session=None, delay=0, max_attempts=None):
+    session = session or db.session
+    if max_attempts is None:
+        max_attempts = current_app.config['JOBS_MAX_ATTEMPTS'] if has_app_context() else 5
+    new_job = Job(
+        kind=kind,
+        payload=json.dumps(payload or {}),
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+        max_attempts=max_attempts,
+    )
+    session.add(new_job)
+    session.info['jobs_enqueued'] = True
+    return new_job
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_workers(session):
+    if session.info.pop('jobs_enqueued', False):
+        _wakeup.set()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_jobs(session):
+    session.info.pop('jobs_enqueued', None)
+
+
+# Pool of worker threads executing jobs from the outbox. Jobs are claimed
+# with an UPDATE guarded by their current state, so any number of workers
+# in any number of processes can share one table. Delivery is at least
+# once: a job whose worker died is handed out again after
+# JOBS_LOCK_TIMEOUT.
+class JobQueue:
+    def __init__(self, app, workers=2, poll_interval=1.0, backoff=5, max_backoff=3600, lock_timeout=300):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lock_timeout = lock_timeout
+        self._threads = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._threads or not self.workers:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name='job-worker-%d' % i, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        atexit.register(self.stop)
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        _wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                ran = self.run_once()
+            except Exception:
+                log.exception('Job worker failed')
+                ran = False
+            if not ran:
+                _wakeup.wait(self.poll_interval)
+                _wakeup.clear()
+
+    # Claims and executes one due job; returns False when none was due.
+    def run_once(self):
+        with self.app.app_context():
+            job_id = self._claim()
+            if job_id is None:
+                return False
+            self._execute(job_id)
+            return True
+
+    def drain(self):
+        done = 0
+        while self.run_once():
+            done += 1
+        return done
+
+    def _claimable(self, now):
+        return or_(
+            and_(Job.status == 'pending', Job.run_at <= now),
+            and_(Job.status == 'running', Job.locked_at < now - timedelta(seconds=self.lock_timeout)),
+        )
+
+    def due_jobs(self, now):
+        return select(Job.id).where(self._claimable(now)).order_by(Job.run_at, Job.id).limit(CLAIM_CANDIDATES)
+
+    def _claim(self):
+        session = db.session
+        now = datetime.utcnow()
+        candidates = session.scalars(self.due_jobs(now)).all()
+        random.shuffle(candidates)
+        for job_id in candidates:
+            result = session.execute(
+                update(Job)
+                .where(Job.id == job_id, self._claimable(now))
+                .values(status='running', locked_at=now, attempts=Job.attempts + 1)
+            )
+            if result.rowcount == 1:
+                session.commit()
+                return job_id
+        session.rollback()
+        return None
+
+    def retry_delay(self, attempts):
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+        return delay * (0.5 + random.random() / 2)
+
+    def _execute(self, job_id):
+        session = db.session
+        claimed = session.get(Job, job_id)
+        try:
+            handler = HANDLERS.get(claimed.kind)
+            if handler is None:
+                raise LookupError('No handler for job kind %r' % claimed.kind)
+            handler(json.loads(claimed.payload))
+        except Exception:
+            session.rollback()
+            claimed = session.get(Job, job_id)
+            claimed.last_error = traceback.format_exc()[-4000:]
+            claimed.locked_at = None
+            if claimed.attempts >= claimed.max_attempts:
+                claimed.status = 'failed'
+                claimed.finished_at = datetime.utcnow()
+                log.error('Job %d (%s) failed permanently after %d attempts', job_id, claimed.kind, claimed.attempts)
+            else:
+                claimed.status = 'pending'
+                claimed.run_at = datetime.utcnow() + timedelta(seconds=self.retry_delay(claimed.attempts))
+                log.warning('Job %d (%s) failed, retry %d at %s', job_id, claimed.kind, claimed.attempts, claimed.run_at)
+        else:
+            claimed.status = 'done'
+            claimed.locked_at = None
+            claimed.last_error = None
+            claimed.finished_at = datetime.utcnow()
+        session.commit()
+
+
+def job_counts(session=None):
+    session = session or db.session
+    return dict(session.execute(select(Job.status, func.count()).group_by(Job.status)).all())
+
+
+def purge_jobs(days=7, session=None):
+    session = session or db.session
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    result = session.execute(
+        Job.__table__.delete().where(Job.status == 'done', Job.finished_at < cutoff)
+    )
+    return result.rowcount
+
+
+def init_jobs(app):
+    # Importing the handlers registers them
+    from software_store_app import notifications
+    notifications.mail.init_app(app)
+    queue = JobQueue(
+        app,
+        workers=app.config['JOBS_WORKERS'],
+        poll_interval=app.config['JOBS_POLL_INTERVAL'],
+        backoff=app.config['JOBS_RETRY_BACKOFF'],
+        max_backoff=app.config['JOBS_MAX_BACKOFF'],
+        lock_timeout=app.config['JOBS_LOCK_TIMEOUT'],
+    )
+    app.extensions['jobs'] = queue
+    # Workers start with the first request, so CLI commands and scripts
+    # that only build the app do not spawn threads
+    if queue.workers:
+        app.before_request(queue.start)
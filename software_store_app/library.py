@@ -0,0 +1,98 @@
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from software_store_app import cache, db
+from software_store_app.models import Purchase, Software
+from software_store_app.pagination import decode_cursor, encode_cursor, keyset_filter, keyset_order
+
+# A user's purchases, newest first. Pages are read from the covering
+# ix_purchase_user_library index plus one primary key lookup per product, so
+# the cost of a page does not depend on how many licenses the user owns.
+CURSOR_COLUMNS = (Purchase.purchase_date, Purchase.id)
+
+
+def parse_library_cursor(token):
+    if not token:
+        return None
+    return decode_cursor(token, CURSOR_COLUMNS)
+
+
+def library_query(user_id, after=None):
+    query = (
+        select(Purchase.id, Purchase.purchase_date, Purchase.license_key, Software.id, Software.name)
+        .join(Software, Software.id == Purchase.software_id)
+        .where(Purchase.user_id == user_id)
+        .order_by(*keyset_order(Purchase.purchase_date, Purchase.id, descending=True))
+    )
+    if after is not None:
+        purchase_date, last_id = after
+        # purchase_date always has a value (column default)
+        query = query.where(keyset_filter(Purchase.purchase_date, Purchase.id, purchase_date, last_id,
+                                          descending=True, nullable=False))
+    return query
+
+
+def library_page(user_id, after=None, limit=25):
+    rows = db.session.execute(library_query(user_id, after).limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][1], rows[-1][0]])
+    items = [{
+        'purchase_id': purchase_id,
+        'purchased_at': purchase_date.isoformat() if purchase_date else None,
+        'license_key': license_key,
+        'software_id': software_id,
+        'software_name': software_name,
+    } for purchase_id, purchase_date, license_key, software_id, software_name in rows]
+    return items, next_cursor
+
+
+def _count_key(user_id):
+    return 'library:count:%d' % user_id
+
+
+def library_count(user_id):
+    return cache.get_or_set(
+        _count_key(user_id),
+        lambda: db.session.scalar(select(func.count()).select_from(Purchase).where(Purchase.user_id == user_id)),
+        timeout=current_app.config['LIBRARY_COUNT_TTL'],
+    )
+
+
+# Remembers whose purchases a flush changed, including both owners of a
+# purchase moved to another user in the editor, so their cached counts can
+# be dropped once the transaction commits.
+@event.listens_for(Session, 'after_flush')
+def _collect_library_changes(session, flush_context):
+    users = set()
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, Purchase):
+            users.add(inspect(obj).dict.get('user_id'))
+    for obj in session.dirty:
+        if isinstance(obj, Purchase):
+            history = inspect(obj).attrs.user_id.history
+            users.update(history.deleted + history.added)
+    note_library_changes(session, users)
+
+
+# Drops these users' cached counts once `session` commits; called directly by
+# set-based writes that skip the flush.
+def note_library_changes(session, user_ids):
+    users = {int(user_id) for user_id in user_ids if user_id is not None}
+    if users:
+        session.info.setdefault('library_users', set()).update(users)
+
+
+@event.listens_for(Session, 'after_commit')
+def _drop_library_counts(session):
+    users = session.info.pop('library_users', None)
+    if users and has_app_context():
+        for user_id in users:
+            cache.delete(_count_key(user_id))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_library_changes(session):
+    session.info.pop('library_users', None)
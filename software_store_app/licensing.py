@@ -0,0 +1,141 @@
+import random
+import re
+import secrets
+import string
+from datetime import datetime
+
+from flask import current_app, has_app_context
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from software_store_app import db
+from software_store_app.models import LicenseKeyPool, Purchase, Software
+
+KEY_ALPHABET = string.ascii_uppercase + string.digits
+KEY_LENGTH = 20
+KEY_PATTERN = re.compile(r'^[A-Z0-9]{%d}$' % KEY_LENGTH)
+
+# Free keys fetched per claim attempt. Concurrent buyers pick among them at
+# random so they rarely race for the same row.
+CLAIM_CANDIDATES = 16
+
+# Claim rounds before allocate_license_keys() gives up with PoolContention
+CLAIM_ATTEMPTS = 10
+
+
+# Other transactions kept taking the candidate keys. Retry in a new
+# transaction, which sees their claims.
+class PoolContention(Exception):
+    pass
+
+
+def generate_license_key():
+    return ''.join(secrets.choice(KEY_ALPHABET) for _ in range(KEY_LENGTH))
+
+
+def _batch_size():
+    if has_app_context():
+        return current_app.config.get('LICENSE_POOL_BATCH', 1000)
+    return 1000
+
+
+# Adds `size` new keys to the pool in the caller's transaction. Keys that
+# clash with one already pooled or issued are replaced before insert, so
+# callers never see a collision.
+def refill_pool(session=None, size=None):
+    session = session or db.session
+    size = size or _batch_size()
+    added = 0
+    while added < size:
+        keys = {generate_license_key() for _ in range(size - added)}
+        taken = set(session.scalars(select(LicenseKeyPool.key).where(LicenseKeyPool.key.in_(keys))))
+        taken.update(session.scalars(select(Purchase.license_key).where(Purchase.license_key.in_(keys))))
+        taken.update(session.scalars(select(Software.license_key).where(Software.license_key.in_(keys))))
+        keys -= taken
+        if not keys:
+            continue
+        try:
+            with session.begin_nested():
+                session.execute(insert(LicenseKeyPool), [{'key': key} for key in keys])
+        except IntegrityError:
+            # Another process pooled one of these keys meanwhile; draw again
+            continue
+        added += len(keys)
+    return added
+
+
+# Claims `count` unused keys for the caller's transaction. A claim is an
+# UPDATE guarded by "allocated_at IS NULL", so when two buyers pick the same
+# row only one update matches and the other moves on to the next candidate.
+# On server databases the candidates are read with FOR UPDATE SKIP LOCKED:
+# a locking read sees the latest commits even under REPEATABLE READ, and
+# rows another buyer holds are skipped rather than waited for (SQLite
+# ignores the clause; its writers are serialized anyway). If the
+# transaction rolls back the keys return to the pool.
+def allocate_license_keys(count, session=None):
+    session = session or db.session
+    claimed = []
+    for _ in range(CLAIM_ATTEMPTS):
+        candidates = session.execute(
+            select(LicenseKeyPool.id, LicenseKeyPool.key)
+            .where(LicenseKeyPool.allocated_at.is_(None))
+            .order_by(LicenseKeyPool.id)
+            .limit(max(CLAIM_CANDIDATES, count - len(claimed)))
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not candidates:
+            refill_pool(session, max(_batch_size(), count - len(claimed)))
+            continue
+        random.shuffle(candidates)
+        now = datetime.utcnow()
+        for key_id, key in candidates:
+            result = session.execute(
+                update(LicenseKeyPool)
+                .where(LicenseKeyPool.id == key_id, LicenseKeyPool.allocated_at.is_(None))
+                .values(allocated_at=now)
+            )
+            if result.rowcount == 1:
+                claimed.append(key)
+                if len(claimed) == count:
+                    return claimed
+    raise PoolContention('Could not claim %d license keys after %d attempts' % (count, CLAIM_ATTEMPTS))
+
+
+def allocate_license_key(session=None):
+    return allocate_license_keys(1, session)[0]
+
+
+def pool_status(session=None):
+    session = session or db.session
+    free = session.scalar(
+        select(db.func.count()).select_from(LicenseKeyPool).where(LicenseKeyPool.allocated_at.is_(None))
+    )
+    issued = session.scalar(
+        select(db.func.count()).select_from(LicenseKeyPool).where(LicenseKeyPool.allocated_at.isnot(None))
+    )
+    return {'free': free, 'issued': issued}
+
+
+# Looks a key up through the index on purchase.license_key. Malformed keys are
+# rejected without touching the database.
+def validate_license_key(key, session=None):
+    session = session or db.session
+    key = (key or '').strip().upper()
+    if not KEY_PATTERN.match(key):
+        return None
+    row = session.execute(
+        select(Purchase.id, Purchase.purchase_date, Software.id, Software.name)
+        .join(Software, Software.id == Purchase.software_id)
+        .where(Purchase.license_key == key)
+        .limit(1)
+    ).first()
+    if row is None:
+        return None
+    purchase_id, purchase_date, software_id, software_name = row
+    return {
+        'license_key': key,
+        'purchase_id': purchase_id,
+        'purchased_at': purchase_date.isoformat() if purchase_date else None,
+        'software_id': software_id,
+        'software_name': software_name,
+    }
@@ -0,0 +1,79 @@
+import os
+import socketserver
+import time
+from email import message_from_bytes, policy
+
+# Minimal SMTP server that accepts every message and either prints it or
+# saves it as an .eml file. Development stand-in for a real mail server;
+# it speaks just enough SMTP for smtplib/Flask-Mail without TLS or auth.
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.reply('220 localhost mail sink ready')
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip()
+            verb = command[:4].upper()
+            if verb in ('HELO', 'EHLO'):
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                sender, recipients = command[10:].strip(), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command[8:].strip())
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                self.server.deliver(sender, recipients, self._read_data())
+                self.reply('250 OK')
+            elif verb == 'RSET':
+                sender, recipients = None, []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+    def _read_data(self):
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if not line or line.rstrip(b'\r\n') == b'.':
+                return b''.join(lines)
+            # Undo dot-stuffing
+            lines.append(line[1:] if line.startswith(b'..') else line)
+
+
+class MailSink(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, output_dir=None, echo=print):
+        super().__init__(address, SMTPHandler)
+        self.output_dir = output_dir
+        self.echo = echo
+        self.count = 0
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def deliver(self, sender, recipients, data):
+        self.count += 1
+        message = message_from_bytes(data, policy=policy.default)
+        if self.output_dir:
+            path = os.path.join(self.output_dir, '%d-%04d.eml' % (time.time() * 1000, self.count))
+            with open(path, 'wb') as f:
+                f.write(data)
+            self.echo('%s -> %s: %s (%s)' % (sender, ', '.join(recipients), message['Subject'], path))
+        else:
+            self.echo('---------- %s -> %s' % (sender, ', '.join(recipients)))
+            self.echo(data.decode('utf-8', 'replace'))
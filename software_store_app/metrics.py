@@ -0,0 +1,248 @@
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter as StackCounter, defaultdict
+
+from flask import Response, abort, current_app, g, has_request_context, request
+from flask import before_render_template, template_rendered
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _labels(names, values):
+    return ','.join('%s="%s"' % (name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+                    for name, value in zip(names, values))
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield '%s{%s} %r' % (self.name, _labels(self.labels, labels), value)
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [count per bucket..., sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            values = sorted((labels, list(row)) for labels, row in self._values.items())
+        for labels, row in values:
+            label_text = _labels(self.labels, labels)
+            for bound, count in zip(self.buckets, row):
+                yield '%s_bucket{%s,le="%r"} %d' % (self.name, label_text, float(bound), count)
+            yield '%s_bucket{%s,le="+Inf"} %d' % (self.name, label_text, row[-1])
+            yield '%s_sum{%s} %r' % (self.name, label_text, row[-2])
+            yield '%s_count{%s} %d' % (self.name, label_text, row[-1])
+
+
+class Metrics:
+    def __init__(self, prefix='software_store'):
+        self.requests = Counter(
+            prefix + '_requests_total', 'Requests handled.', ('endpoint', 'method', 'status'))
+        self.latency = Histogram(
+            prefix + '_request_duration_seconds', 'Request latency.', ('endpoint',), LATENCY_BUCKETS)
+        self.queries = Histogram(
+            prefix + '_sql_queries_per_request', 'SQL statements issued per request.', ('endpoint',),
+            QUERY_BUCKETS)
+        self.sql_time = Counter(
+            prefix + '_sql_duration_seconds_total', 'Time spent executing SQL.', ('endpoint',))
+        self.template_time = Counter(
+            prefix + '_template_render_seconds_total', 'Time spent rendering templates.', ('endpoint',))
+
+    def render(self):
+        lines = []
+        for metric in (self.requests, self.latency, self.queries, self.sql_time, self.template_time):
+            lines.append('# HELP %s %s' % (metric.name, metric.help))
+            lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+# Samples one thread's Python stack every `interval` seconds and counts
+# identical stacks, giving the "folded" format read by flamegraph.pl and
+# speedscope: one "outer;...;inner count" line per distinct stack.
+class StackSampler:
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = StackCounter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[_fold(frame)] += 1
+
+    def folded(self):
+        return ''.join('%s %d\n' % item for item in self.stacks.most_common())
+
+
+def _fold(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('%s:%s' % (os.path.basename(code.co_filename), code.co_name))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def _endpoint():
+    return request.url_rule.endpoint if request.url_rule else 'unmatched'
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    g.sql_queries = 0
+    g.sql_time = 0.0
+    g.template_time = 0.0
+    config = current_app.config
+    value = request.headers.get('X-Profile')
+    if value and config['PROFILING_ENABLED']:
+        token = config['PROFILING_TOKEN']
+        if not token or hmac.compare_digest(value, token):
+            g.profiler = StackSampler(threading.get_ident(), config['PROFILING_INTERVAL'])
+            g.profiler.start()
+
+
+def _after_request(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _teardown_request(exc):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    metrics = current_app.extensions['metrics']
+    endpoint = _endpoint()
+    status = g.pop('metrics_status', 500)
+    metrics.requests.inc((endpoint, request.method, status))
+    metrics.latency.observe((endpoint,), elapsed)
+    metrics.queries.observe((endpoint,), g.sql_queries)
+    metrics.sql_time.inc((endpoint,), g.sql_time)
+    metrics.template_time.inc((endpoint,), g.template_time)
+
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        if elapsed >= current_app.config['PROFILING_SLOW_THRESHOLD']:
+            _dump_profile(profiler, endpoint, elapsed)
+
+
+def _dump_profile(profiler, endpoint, elapsed):
+    directory = current_app.config['PROFILING_DIR'] or os.path.join(current_app.instance_path, 'profiles')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, '%s-%s-%dms.folded' % (
+        time.strftime('%Y%m%d-%H%M%S'), endpoint, elapsed * 1000))
+    with open(path, 'w') as f:
+        f.write(profiler.folded())
+    current_app.logger.info('Profile of %s (%.0f ms) written to %s', request.path, elapsed * 1000, path)
+
+
+# The start time lives on the statement's execution context, not on the
+# pooled connection, so a statement that raises leaves nothing behind for
+# the next one to pick up.
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.metrics_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_queries' in g:
+        g.sql_queries += 1
+        start = getattr(context, 'metrics_query_start', None)
+        if start is not None:
+            g.sql_time += time.perf_counter() - start
+
+
+def _before_render(sender, template, context, **extra):
+    if has_request_context():
+        g.template_start = time.perf_counter()
+
+
+def _rendered(sender, template, context, **extra):
+    start = g.pop('template_start', None) if has_request_context() else None
+    if start is not None and 'template_time' in g:
+        g.template_time += time.perf_counter() - start
+
+
+# Without a METRICS_TOKEN the endpoint only answers in debug and testing,
+# so a public store never publishes its traffic and latency by default
+def metrics_view():
+    token = current_app.config['METRICS_TOKEN']
+    if not token:
+        if not (current_app.debug or current_app.testing):
+            abort(404)
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer ' + token):
+        abort(401)
+    return Response(current_app.extensions['metrics'].render(),
+                    mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Counts an engine's statements towards the request that issued them
+def instrument_engine(engine):
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def init_metrics(app, db):
+    if not app.config['METRICS_ENABLED']:
+        return
+    app.extensions['metrics'] = Metrics()
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+    with app.app_context():
+        instrument_engine(db.engine)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
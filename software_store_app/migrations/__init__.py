@@ -0,0 +1,133 @@
+import importlib
+import pkgutil
+import re
+import time
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+
+# Versioned schema changes for databases created before the models changed.
+# Each module here named v<NNNN>_<name>.py defines `upgrade(conn)` and may set
+# `transactional = False` for DDL that must run outside a transaction.
+# Applied versions are recorded in the schema_version table; databases
+# created from scratch by create_schema() are stamped as up to date, since
+# create_all() already builds them from the current models.
+
+MODULE_PATTERN = re.compile(r'^v(\d+)_(\w+)$')
+
+metadata = MetaData()
+
+schema_version = Table(
+    'schema_version', metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String(100), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+class Migration:
+    def __init__(self, version, name, module):
+        self.version = version
+        self.name = name
+        self.module = module
+
+    @property
+    def description(self):
+        return (self.module.__doc__ or self.name).strip().splitlines()[0]
+
+    @property
+    def transactional(self):
+        return getattr(self.module, 'transactional', True)
+
+
+def load_migrations():
+    migrations = []
+    for info in pkgutil.iter_modules(__path__):
+        match = MODULE_PATTERN.match(info.name)
+        if match:
+            module = importlib.import_module('%s.%s' % (__name__, info.name))
+            migrations.append(Migration(int(match.group(1)), match.group(2), module))
+    migrations.sort(key=lambda m: m.version)
+    versions = [m.version for m in migrations]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError('Duplicate migration versions: %s' % versions)
+    return migrations
+
+
+def applied_versions(engine):
+    if not inspect(engine).has_table('schema_version'):
+        return set()
+    with engine.connect() as conn:
+        return set(conn.scalars(select(schema_version.c.version)))
+
+
+def pending_migrations(engine, target=None):
+    applied = applied_versions(engine)
+    return [m for m in load_migrations()
+            if m.version not in applied and (target is None or m.version <= target)]
+
+
+def _record(conn, migration):
+    conn.execute(schema_version.insert().values(
+        version=migration.version, name=migration.name, applied_at=datetime.utcnow()))
+
+
+# Runs pending migrations in version order, each in its own transaction
+# together with its schema_version row. Returns the migrations applied.
+def upgrade(engine, target=None, echo=None):
+    metadata.create_all(engine)
+    applied = []
+    for migration in pending_migrations(engine, target):
+        if echo:
+            echo('Applying %04d %s...' % (migration.version, migration.description))
+        started = time.perf_counter()
+        if migration.transactional:
+            with engine.begin() as conn:
+                migration.module.upgrade(conn)
+                _record(conn, migration)
+        else:
+            with engine.connect() as conn:
+                migration.module.upgrade(conn.execution_options(isolation_level='AUTOCOMMIT'))
+            with engine.begin() as conn:
+                _record(conn, migration)
+        if echo:
+            echo('  done in %.1fs' % (time.perf_counter() - started))
+        applied.append(migration)
+    if applied and engine.dialect.name == 'sqlite':
+        # Refresh planner statistics for the tables that changed
+        with engine.begin() as conn:
+            conn.exec_driver_sql('PRAGMA optimize')
+    return applied
+
+
+# Marks migrations as applied without running them.
+def stamp(engine, target=None):
+    metadata.create_all(engine)
+    migrations = pending_migrations(engine, target)
+    with engine.begin() as conn:
+        for migration in migrations:
+            _record(conn, migration)
+    return migrations
+
+
+def index_exists(conn, table, name):
+    return any(index['name'] == name for index in inspect(conn).get_indexes(table))
+
+
+# Adds an index while the application keeps running. MySQL builds it in place
+# without locking the table. SQLite has no online index build: readers carry
+# on (in WAL mode) but writers wait until it finishes, so large tables are
+# best indexed when traffic is low.
+def create_index(conn, name, table, columns):
+    if not inspect(conn).has_table(table) or index_exists(conn, table, name):
+        return False
+    dialect = conn.dialect.name
+    preparer = conn.dialect.identifier_preparer
+    column_list = ', '.join(preparer.quote(column) for column in columns)
+    if dialect in ('mysql', 'mariadb'):
+        conn.execute(text('ALTER TABLE %s ADD INDEX %s (%s), ALGORITHM=INPLACE, LOCK=NONE' % (
+            preparer.quote(table), preparer.quote(name), column_list)))
+    else:
+        conn.execute(text('CREATE INDEX IF NOT EXISTS %s ON %s (%s)' % (
+            preparer.quote(name), preparer.quote(table), column_list)))
+    return True
@@ -0,0 +1,11 @@
+"""Index purchase.user_id, purchase.software_id and purchase.purchase_date"""
+from software_store_app.migrations import create_index
+
+# Run outside a transaction so MySQL can build the indexes in place
+transactional = False
+
+
+def upgrade(conn):
+    create_index(conn, 'ix_purchase_user_id', 'purchase', ['user_id'])
+    create_index(conn, 'ix_purchase_software_id', 'purchase', ['software_id'])
+    create_index(conn, 'ix_purchase_purchase_date', 'purchase', ['purchase_date'])
@@ -0,0 +1,11 @@
+"""Covering index for listing a user's purchases by date"""
+from software_store_app.migrations import create_index
+
+transactional = False
+
+
+def upgrade(conn):
+    # ix_purchase_user_id stays: the editor lists a user's purchases in id
+    # order, which this index cannot provide without a sort
+    create_index(conn, 'ix_purchase_user_library', 'purchase',
+                 ['user_id', 'purchase_date', 'id', 'software_id', 'license_key'])
@@ -0,0 +1,15 @@
+"""Create the catalog change log and seed it with the current catalog"""
+from sqlalchemy import func, insert, select
+
+from software_store_app.models import CatalogChange, Software
+
+
+def upgrade(conn):
+    CatalogChange.__table__.create(conn, checkfirst=True)
+    if conn.scalar(select(func.count()).select_from(CatalogChange)):
+        return
+    # Clients syncing from seq 0 must see products that predate the log
+    conn.execute(insert(CatalogChange).from_select(
+        ['software_id', 'changed_at'],
+        select(Software.id, func.coalesce(Software.created_at, func.current_timestamp())).order_by(Software.id),
+    ))
@@ -0,0 +1,11 @@
+"""Index software by (created_at, id) and purchase.license_key"""
+from software_store_app.migrations import create_index
+
+transactional = False
+
+
+def upgrade(conn):
+    # Keyset pagination of the catalog, newest first
+    create_index(conn, 'ix_software_created_at_id', 'software', ['created_at', 'id'])
+    # License key validation
+    create_index(conn, 'ix_purchase_license_key', 'purchase', ['license_key'])
@@ -1,11 +1,8 @@
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
-from software_store_app import db, login_manager
-
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
+from software_store_app import db
+from software_store_app.security import session_stamp
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -15,7 +12,15 @@ class User(UserMixin, db.Model):
     is_admin = db.Column(db.Boolean, default=False)
     purchases = db.relationship('Purchase', backref='user', lazy=True)
 
+    # Session id '<id>:<stamp>'; see identity.load_user
+    def get_id(self):
+        return '%d:%s' % (self.id, session_stamp(self))
+
 class Software(db.Model):
+    __table_args__ = (
+        db.Index('ix_software_created_at_id', 'created_at', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=False)
@@ -26,8 +31,105 @@ class Software(db.Model):
     purchases = db.relationship('Purchase', backref='software', lazy=True)
 
 class Purchase(db.Model):
+    # A user's library is read from this index alone, newest first, without
+    # touching the table (migrations/v0002)
+    __table_args__ = (
+        db.Index('ix_purchase_user_library', 'user_id', 'purchase_date', 'id', 'software_id', 'license_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Indexes added to existing databases by migrations/v0001 and v0004
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    software_id = db.Column(db.Integer, db.ForeignKey('software.id'), nullable=False, index=True)
+    purchase_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    license_key = db.Column(db.String(100), nullable=False, index=True)
+
+# Pre-generated license keys. Purchases claim a free row by stamping
+# allocated_at, so every key ever issued stays here and the unique
+# constraint guarantees no key is handed out twice.
+class LicenseKeyPool(db.Model):
+    __tablename__ = 'license_key_pool'
+    __table_args__ = (
+        db.Index('ix_license_key_pool_free', 'allocated_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(100), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    allocated_at = db.Column(db.DateTime)
+
+# Idempotency keys supplied by purchase clients. The unique constraint makes
+# a replayed or concurrent duplicate request fail its insert, after which the
+# original purchase is returned instead of creating a new one.
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_key'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_idempotency_key_user_key'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    software_id = db.Column(db.Integer, db.ForeignKey('software.id'), nullable=False)
-    purchase_date = db.Column(db.DateTime, default=datetime.utcnow)
-    license_key = db.Column(db.String(100), nullable=False)
+    key = db.Column(db.String(64), nullable=False)
+    purchase_id = db.Column(db.Integer, db.ForeignKey('purchase.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Sales rollups maintained by the analytics module: purchase count and
+# revenue per software per UTC day, and per software overall. Analytics
+# queries read only these tables, never the purchase history.
+class SalesDaily(db.Model):
+    __tablename__ = 'sales_daily'
+    __table_args__ = (
+        db.Index('ix_sales_daily_day', 'day'),
+    )
+
+    software_id = db.Column(db.Integer, db.ForeignKey('software.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    purchases = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+class SalesTotal(db.Model):
+    __tablename__ = 'sales_total'
+    __table_args__ = (
+        db.Index('ix_sales_total_purchases', 'purchases'),
+        db.Index('ix_sales_total_revenue', 'revenue'),
+    )
+
+    software_id = db.Column(db.Integer, db.ForeignKey('software.id'), primary_key=True)
+    purchases = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+# Outbox of background jobs. Rows are added in the same transaction as the
+# change that caused them and picked up by the worker pool in jobs.py.
+class Job(db.Model):
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    # pending -> running -> done, or back to pending for a retry, or failed
+    status = db.Column(db.String(16), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+# Change log behind /api/catalog/changes: one row per insert, update or
+# delete of a product, written in the same transaction. AUTOINCREMENT keeps
+# seq from ever being reused. Compaction keeps only the newest row per
+# product.
+class CatalogChange(db.Model):
+    __tablename__ = 'catalog_change'
+    __table_args__ = (
+        db.Index('ix_catalog_change_software_id_seq', 'software_id', 'seq'),
+        {'sqlite_autoincrement': True},
+    )
+
+    seq = db.Column(db.Integer, primary_key=True)
+    # No foreign key: rows outlive deleted products to announce the deletion
+    software_id = db.Column(db.Integer, nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
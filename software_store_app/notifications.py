@@ -0,0 +1,50 @@
+from flask import render_template
+from flask_mail import Mail, Message
+
+from software_store_app import db
+from software_store_app.jobs import enqueue, job
+from software_store_app.models import Purchase, User
+
+mail = Mail()
+
+
+def _send(subject, recipient, template, **context):
+    mail.send(Message(subject, recipients=[recipient], body=render_template(template, **context)))
+
+
+# Called inside the purchase transaction; the emails go out after commit.
+def enqueue_purchase_emails(purchase, session=None):
+    enqueue('purchase_receipt', {'purchase_id': purchase.id}, session)
+    enqueue('license_delivery', {'purchase_id': purchase.id}, session)
+
+
+def enqueue_welcome_email(user, session=None):
+    enqueue('welcome_email', {'user_id': user.id}, session)
+
+
+# Handlers run on a worker thread inside an app context. A row that has
+# since been deleted means there is nothing left to send.
+@job('purchase_receipt')
+def send_purchase_receipt(payload):
+    purchase = db.session.get(Purchase, payload['purchase_id'])
+    if purchase is None:
+        return
+    _send('Your Software Store receipt #%d' % purchase.id, purchase.user.email,
+          'email/receipt.txt', purchase=purchase)
+
+
+@job('license_delivery')
+def deliver_license(payload):
+    purchase = db.session.get(Purchase, payload['purchase_id'])
+    if purchase is None:
+        return
+    _send('Your license key for %s' % purchase.software.name, purchase.user.email,
+          'email/license.txt', purchase=purchase)
+
+
+@job('welcome_email')
+def send_welcome_email(payload):
+    user = db.session.get(User, payload['user_id'])
+    if user is None:
+        return
+    _send('Welcome to Software Store', user.email, 'email/welcome.txt', user=user)
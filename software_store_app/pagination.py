@@ -0,0 +1,70 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_, tuple_
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+# Cursors are opaque to clients: a url-safe base64 JSON list of the sort
+# values of the last row on the previous page.
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, columns):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor('Malformed cursor')
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise InvalidCursor('Malformed cursor')
+    try:
+        return [_coerce(column, value) for column, value in zip(columns, values)]
+    except (TypeError, ValueError):
+        raise InvalidCursor('Malformed cursor')
+
+
+def _coerce(column, value):
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    return python_type(value)
+
+
+# WHERE clause selecting the rows strictly after (value, last_id) in an
+# ORDER BY column, id_column ordering. NULLs sort lowest, as on SQLite and
+# MySQL, so they come first ascending and last descending. Pass
+# nullable=False for a nullable column that is always filled in, so the
+# filter stays a single index range.
+def keyset_filter(column, id_column, value, last_id, descending=False, nullable=None):
+    if column is id_column:
+        return id_column < last_id if descending else id_column > last_id
+
+    if nullable is None:
+        nullable = getattr(column, 'nullable', False)
+    if descending:
+        if value is None:
+            return and_(column.is_(None), id_column < last_id)
+        after = tuple_(column, id_column) < tuple_(value, last_id)
+        return or_(after, column.is_(None)) if nullable else after
+
+    if value is None:
+        return or_(column.isnot(None), and_(column.is_(None), id_column > last_id))
+    return tuple_(column, id_column) > tuple_(value, last_id)
+
+
+def keyset_order(column, id_column, descending=False):
+    if column is id_column:
+        return [id_column.desc() if descending else id_column.asc()]
+    if descending:
+        return [column.desc(), id_column.desc()]
+    return [column.asc(), id_column.asc()]
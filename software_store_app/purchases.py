@@ -0,0 +1,98 @@
+import random
+
+from flask import current_app, has_app_context
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from software_store_app import db
+from software_store_app.greenlets import sleep
+from software_store_app.licensing import PoolContention, allocate_license_key
+from software_store_app.models import IdempotencyKey, Purchase
+from software_store_app.notifications import enqueue_purchase_emails
+
+MAX_KEY_LENGTH = 64
+
+# MySQL lock wait timeout and deadlock error numbers
+RETRYABLE_MYSQL_ERRORS = (1205, 1213)
+
+
+class IdempotencyConflict(Exception):
+    pass
+
+
+def _setting(name, default):
+    return current_app.config.get(name, default) if has_app_context() else default
+
+
+def is_lock_error(error):
+    if 'database is locked' in str(error.orig):
+        return True
+    return getattr(error.orig, 'errno', None) in RETRYABLE_MYSQL_ERRORS
+
+
+def find_purchase(user_id, key, session=None):
+    session = session or db.session
+    return session.scalars(
+        select(Purchase)
+        .join(IdempotencyKey, IdempotencyKey.purchase_id == Purchase.id)
+        .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+    ).first()
+
+
+# Records a purchase exactly once per (user, idempotency key) and returns
+# (purchase, created). The write transaction is a handful of inserts: claim
+# a license key, insert the purchase, the idempotency key and the outbox
+# rows for the receipt and license emails, which are sent later. Lock
+# contention, or losing every candidate license key to other buyers, rolls
+# back and retries with jittered exponential backoff; a unique-key
+# violation means another request with the same key won, so its purchase is
+# returned instead.
+def purchase_software(user_id, software_id, idempotency_key=None, session=None):
+    session = session or db.session
+    if idempotency_key:
+        existing = find_purchase(user_id, idempotency_key, session)
+        if existing is not None:
+            return _replay(existing, software_id), False
+
+    attempts = _setting('PURCHASE_RETRY_ATTEMPTS', 5)
+    backoff = _setting('PURCHASE_RETRY_BACKOFF', 0.05)
+    for attempt in range(attempts):
+        try:
+            purchase = Purchase(
+                user_id=user_id,
+                software_id=software_id,
+                license_key=allocate_license_key(session),
+            )
+            session.add(purchase)
+            session.flush()
+            if idempotency_key:
+                session.add(IdempotencyKey(user_id=user_id, key=idempotency_key, purchase_id=purchase.id))
+            enqueue_purchase_emails(purchase, session)
+            session.commit()
+            return purchase, True
+        except IntegrityError:
+            session.rollback()
+            existing = find_purchase(user_id, idempotency_key, session) if idempotency_key else None
+            if existing is None:
+                raise
+            return _replay(existing, software_id), False
+        except (OperationalError, PoolContention) as e:
+            session.rollback()
+            if not (isinstance(e, PoolContention) or is_lock_error(e)) or attempt == attempts - 1:
+                raise
+            sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+
+
+def _replay(purchase, software_id):
+    if purchase.software_id != software_id:
+        raise IdempotencyConflict('Idempotency key was already used for a different purchase')
+    return purchase
+
+
+def purchase_to_dict(purchase):
+    return {
+        'purchase_id': purchase.id,
+        'software_id': purchase.software_id,
+        'license_key': purchase.license_key,
+        'purchased_at': purchase.purchase_date.isoformat() if purchase.purchase_date else None,
+    }
@@ -0,0 +1,40 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+# Records every statement sent to the engine inside the block.
+@contextmanager
+def count_queries(engine):
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter)
+
+
+# Fails when the block issues more than `limit` statements, e.g. because a
+# template went back to per-row lazy loads (see tests/test_query_counts.py):
+#
+#     with assert_max_queries(db.engine, 3):
+#         client.get('/admin')
+@contextmanager
+def assert_max_queries(engine, limit):
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        raise AssertionError('%d queries executed, expected at most %d:\n%s' % (
+            counter.count, limit, '\n'.join(counter.statements)))
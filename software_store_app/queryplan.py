@@ -0,0 +1,119 @@
+import re
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event, func, select
+from werkzeug.datastructures import MultiDict
+
+from software_store_app import db
+from software_store_app.analytics import revenue_series, sales_by_software, top_sellers
+from software_store_app.catalog import catalog_page
+from software_store_app.changefeed import catalog_changes
+from software_store_app.library import library_page
+from software_store_app.licensing import generate_license_key, validate_license_key
+from software_store_app.models import Purchase, Software, User
+from software_store_app.purchases import find_purchase
+from software_store_app.search import search_software
+
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+LIMIT = re.compile(r'\bLIMIT\b', re.IGNORECASE)
+WHERE = re.compile(r'\bWHERE\b', re.IGNORECASE)
+
+
+# The queries behind the busiest pages and APIs, run through the same code
+# the views use. Each entry is (name, callable, tables the query reads in
+# full by design, e.g. the admin panel listing every product).
+def hot_queries():
+    from software_store_app.editor import grids
+
+    def grid(table, **args):
+        def run():
+            grids[table].clear_counts()
+            grids[table].page(MultiDict(args))
+        return run
+
+    queue = current_app.extensions['jobs']
+    return [
+        ('catalog page', lambda: catalog_page(limit=24), ()),
+        ('catalog next page', lambda: catalog_page([datetime.utcnow(), 1], limit=24), ()),
+        ('catalog changes', lambda: catalog_changes(10 ** 9), ()),
+        ('search', lambda: search_software(db.session, 'office suite'), ()),
+        ('login', lambda: db.session.scalars(select(User).filter_by(email='someone@example.com')).first(), ()),
+        ('library page', lambda: library_page(1), ()),
+        ('library next page', lambda: library_page(1, [datetime.utcnow(), 1]), ()),
+        ('library count', lambda: db.session.scalar(
+            select(func.count()).select_from(Purchase).where(Purchase.user_id == 1)), ()),
+        ('purchase replay', lambda: find_purchase(1, 'key'), ()),
+        ('license validation', lambda: validate_license_key(generate_license_key()), ()),
+        ('admin sales', sales_by_software, ('sales_total',)),
+        ('admin products', lambda: db.session.scalars(select(Software)).all(), ('software',)),
+        ('analytics top sellers', lambda: top_sellers(10), ()),
+        ('analytics revenue', lambda: revenue_series(30, 1), ()),
+        ('editor purchases', grid('purchases'), ()),
+        ('editor purchases by date', grid('purchases', sort='-purchase_date'), ()),
+        ('editor purchases of user', grid('purchases', user_id='1'), ()),
+        ('editor purchases of product', grid('purchases', software_id='1'), ()),
+        ('editor users', grid('users'), ()),
+        ('due jobs', lambda: db.session.scalars(queue.due_jobs(datetime.utcnow())).all(), ()),
+    ]
+
+
+# Runs `func` and returns the (statement, parameters) pairs it executed.
+def capture_statements(engine, func):
+    captured = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            captured.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_execute)
+    try:
+        func()
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_execute)
+    return captured
+
+
+# Returns (plan lines, fully scanned tables) for one statement.
+def explain(conn, statement, parameters):
+    dialect = conn.dialect.name
+    if dialect == 'sqlite':
+        rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+        lines = [row[-1] for row in rows]
+        # An unfiltered scan already in ORDER BY order (rowid order for an id
+        # sort) stops after LIMIT rows, so a first page is not a full scan
+        if LIMIT.search(statement) and not WHERE.search(statement) \
+                and not any('TEMP B-TREE' in line for line in lines):
+            return lines, []
+        scans = [m.group(1) for m in map(SQLITE_SCAN.match, lines) if m]
+        return lines, scans
+    if dialect in ('mysql', 'mariadb'):
+        rows = conn.exec_driver_sql('EXPLAIN ' + statement, parameters).mappings().all()
+        lines = ['%s: type=%s key=%s rows=%s %s' % (
+            row['table'], row['type'], row['key'], row['rows'], row['Extra'] or '') for row in rows]
+        scans = [row['table'] for row in rows if row['type'] == 'ALL']
+        return lines, scans
+    raise NotImplementedError('Query plans are not supported for %s' % dialect)
+
+
+# Explains every statement the hot queries issue. Returns a list of
+# {'name', 'statement', 'plan', 'scans'}; 'scans' leaves out the full scans
+# a query is expected to do.
+def explain_hot_queries(names=None):
+    engine = db.engine
+    results = []
+    for name, func, expected in hot_queries():
+        if names and name not in names:
+            continue
+        statements = capture_statements(engine, func)
+        db.session.rollback()
+        with engine.connect() as conn:
+            for statement, parameters in statements:
+                plan, scans = explain(conn, statement, parameters)
+                results.append({
+                    'name': name,
+                    'statement': statement,
+                    'plan': plan,
+                    'scans': [table for table in scans if table not in expected],
+                })
+    return results
@@ -0,0 +1,39 @@
+import math
+import threading
+import time
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__('Rate limit exceeded')
+        self.retry_after = retry_after
+
+
+# In-process token buckets keyed by an arbitrary string. Each key holds up to
+# `capacity` tokens and regains `rate` tokens per second.
+class TokenBucket:
+    def __init__(self, capacity, rate, max_keys=100000):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, tokens=1):
+        now = time.monotonic()
+        with self._lock:
+            available, updated = self._buckets.get(key, (self.capacity, now))
+            available = min(self.capacity, available + (now - updated) * self.rate)
+            if available < tokens:
+                self._buckets[key] = (available, now)
+                raise RateLimited(max(1, math.ceil((tokens - available) / self.rate)))
+            self._buckets[key] = (available - tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+
+    # Drops buckets that would be full by now; they behave like absent keys.
+    def _prune(self, now):
+        full = [key for key, (available, updated) in self._buckets.items()
+                if available + (now - updated) * self.rate >= self.capacity]
+        for key in full:
+            del self._buckets[key]
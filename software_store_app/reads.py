@@ -0,0 +1,219 @@
+import glob
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from flask.globals import app_ctx
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, scoped_session
+from werkzeug.local import LocalProxy
+
+from software_store_app import db
+from software_store_app.database import is_sqlite
+
+log = logging.getLogger(__name__)
+
+# Where the editor's dashboard tables read from (EDITOR_READS):
+#
+#   primary   the main database, like every other view
+#   replica   EDITOR_REPLICA_URL, by default the primary SQLite file opened
+#             read-only so browsing can never take a write lock
+#   snapshot  a private copy of the SQLite database taken with the backup
+#             API every EDITOR_SNAPSHOT_MAX_AGE / 2 seconds; once the copy is
+#             older than EDITOR_SNAPSHOT_MAX_AGE reads go to the primary
+#
+# Writes, and the forms that load a row to edit it, always use db.session.
+
+
+def _app_ctx_id():
+    return id(app_ctx._get_current_object())
+
+
+def _query_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA query_only=ON')
+    cursor.close()
+
+
+class PrimaryReads:
+    name = 'primary'
+
+    def start(self):
+        pass
+
+    def session(self):
+        return db.session
+
+    def remove(self):
+        pass
+
+    def changed(self):
+        pass
+
+    def status(self):
+        return {'source': self.name, 'as_of': None}
+
+
+class ReplicaReads(PrimaryReads):
+    name = 'replica'
+
+    def __init__(self, url, engine_options=None):
+        self.engine = create_engine(url, **(engine_options or {}))
+        if self.engine.dialect.name == 'sqlite':
+            event.listen(self.engine, 'connect', _query_only)
+        self._sessions = scoped_session(lambda: Session(self.engine), scopefunc=_app_ctx_id)
+
+    def session(self):
+        return self._sessions()
+
+    def remove(self):
+        self._sessions.remove()
+
+
+class SnapshotReads(PrimaryReads):
+    name = 'snapshot'
+
+    def __init__(self, source_path, directory, max_age=60, busy_timeout=5.0):
+        self.source_path = source_path
+        self.directory = directory
+        self.max_age = max_age
+        self.busy_timeout = busy_timeout
+        self.engine = None
+        self.path = None
+        self.taken_at = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._sessions = scoped_session(self._new_session, scopefunc=_app_ctx_id)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='editor-snapshot', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                log.exception('Could not refresh the editor snapshot')
+            self._wakeup.wait(self.max_age / 2.0)
+            self._wakeup.clear()
+
+    # Copies the database into a new file and switches reads over to it. In
+    # WAL mode the copy runs as an ordinary reader, so purchases keep
+    # committing while it is taken.
+    def refresh(self):
+        os.makedirs(self.directory, exist_ok=True)
+        started = time.time()
+        # Every worker process keeps its own snapshots in the shared directory
+        path = os.path.join(self.directory, 'snapshot-%d-%d.db' % (os.getpid(), started * 1000))
+        source = sqlite3.connect(self.source_path, timeout=self.busy_timeout)
+        target = sqlite3.connect(path)
+        try:
+            source.backup(target)
+            # The copy keeps the source's WAL mode; a private read-only file
+            # has no use for it
+            target.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            target.close()
+            source.close()
+        engine = create_engine('sqlite:///' + path)
+        event.listen(engine, 'connect', _query_only)
+        with self._lock:
+            old = self.engine
+            self.engine, self.path, self.taken_at = engine, path, started
+        if old is not None:
+            old.dispose()
+        self._remove_old_files()
+        log.info('Editor snapshot refreshed in %.2fs', time.time() - started)
+
+    # Removes this process's older snapshots. Other processes' files are
+    # left to them unless they are far past max_age, which only happens once
+    # the process that took them has gone.
+    def _remove_old_files(self):
+        own = os.path.join(self.directory, 'snapshot-%d-' % os.getpid())
+        abandoned = time.time() - 10 * self.max_age
+        for path in glob.glob(os.path.join(self.directory, 'snapshot-*.db')):
+            if path == self.path:
+                continue
+            try:
+                if path.startswith(own) or os.path.getmtime(path) < abandoned:
+                    os.remove(path)
+            except OSError:
+                # Still open by a request that started before the swap
+                # (Windows); removed after a later refresh
+                pass
+
+    def fresh(self):
+        return self.taken_at is not None and time.time() - self.taken_at <= self.max_age
+
+    def _new_session(self):
+        return Session(self.engine)
+
+    def session(self):
+        if not self.fresh():
+            return db.session
+        return self._sessions()
+
+    def remove(self):
+        self._sessions.remove()
+
+    # Called after the editor saves something so the tables show it soon
+    def changed(self):
+        self._wakeup.set()
+
+    def status(self):
+        if not self.fresh():
+            return {'source': 'primary', 'as_of': None}
+        return {
+            'source': self.name,
+            'as_of': datetime.utcfromtimestamp(self.taken_at).isoformat() + 'Z',
+            'max_age': self.max_age,
+        }
+
+
+# Session for read-only editor queries; see EDITOR_READS
+editor_reads = LocalProxy(lambda: current_app.extensions['editor_reads'].session())
+
+
+def init_reads(app):
+    mode = app.config['EDITOR_READS']
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if mode == 'primary':
+        reads = PrimaryReads()
+    elif mode == 'replica':
+        url = app.config['EDITOR_REPLICA_URL']
+        if not url:
+            if not is_sqlite(uri):
+                raise ValueError('EDITOR_REPLICA_URL is required unless the database is SQLite')
+            with app.app_context():
+                path = db.engine.url.database
+            url = 'sqlite:///file:%s?mode=ro&uri=true' % path.replace('\\', '/')
+        reads = ReplicaReads(url, {'connect_args': {'timeout': app.config['SQLITE_BUSY_TIMEOUT'] / 1000.0}}
+                             if is_sqlite(url) else None)
+    elif mode == 'snapshot':
+        if not is_sqlite(uri):
+            raise ValueError('EDITOR_READS=snapshot needs an SQLite database; use replica instead')
+        with app.app_context():
+            path = db.engine.url.database
+        reads = SnapshotReads(
+            path,
+            app.config['EDITOR_SNAPSHOT_DIR'] or os.path.join(app.instance_path, 'snapshots'),
+            app.config['EDITOR_SNAPSHOT_MAX_AGE'],
+            app.config['SQLITE_BUSY_TIMEOUT'] / 1000.0,
+        )
+    else:
+        raise ValueError('Unknown EDITOR_READS: %r' % mode)
+    app.extensions['editor_reads'] = reads
+    app.teardown_appcontext(lambda exc: reads.remove())
+    # Like the job workers, the refresher starts with the first request
+    if mode == 'snapshot':
+        app.before_request(reads.start)
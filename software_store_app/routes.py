@@ -1,74 +1,284 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify
+import hashlib
+import io
+import json
+
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, abort, current_app, Response, stream_with_context, session, make_response
+from markupsafe import Markup
 from flask_login import login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
-from software_store_app import app, db
-import string
-import random
-from software_store_app.models import User, Software, Purchase
-
-@app.route('/')
+from datetime import datetime, timezone
+from software_store_app import cache, db
+from software_store_app.models import User, Software
+from software_store_app.catalog import (
+    cached_catalog_page, catalog_state, invalidate_catalog, iter_catalog_pages, parse_catalog_cursor, software_to_dict,
+)
+from software_store_app.pagination import InvalidCursor
+from software_store_app.search import search_software
+from software_store_app.changefeed import catalog_changes
+from software_store_app.security import hash_password, limit_auth_attempt, needs_rehash, verify_password
+from software_store_app.identity import forget_user
+from software_store_app.library import library_count, library_page, parse_library_cursor
+from software_store_app.licensing import validate_license_key
+from software_store_app.notifications import enqueue_welcome_email
+from software_store_app.purchases import MAX_KEY_LENGTH, IdempotencyConflict, purchase_software, purchase_to_dict
+from software_store_app.assets import enqueue_thumbnails
+from software_store_app.analytics import revenue_series, sales_by_software, top_sellers
+from software_store_app.bulk import EXPORTS, FORMATS, detect_format, export_rows, import_software, iter_records
+
+storefront = Blueprint('storefront', __name__)
+
+def _catalog_args():
+    limit = request.args.get('limit', type=int) or current_app.config['CATALOG_PAGE_SIZE']
+    limit = max(1, min(limit, current_app.config['CATALOG_MAX_PAGE_SIZE']))
+    try:
+        after = parse_catalog_cursor(request.args.get('cursor'))
+    except InvalidCursor:
+        abort(400)
+    return after, limit
+
+# Validators for a catalog page. The ETag covers the catalog version, the
+# page and, for HTML pages, the user, since the navbar differs per user.
+def _catalog_validators(state, limit, per_user):
+    parts = [state['version'], request.args.get('cursor', ''), str(limit)]
+    if per_user:
+        parts.append(current_user.get_id() or '')
+    etag = hashlib.md5(':'.join(parts).encode()).hexdigest()
+    return etag, datetime.fromtimestamp(state['last_modified'], timezone.utc)
+
+def _not_modified(etag, last_modified):
+    # Pending flash messages must be rendered, never swallowed by a 304
+    if '_flashes' in session:
+        return False
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    return request.if_modified_since is not None and request.if_modified_since >= last_modified
+
+def _conditional(response, etag, last_modified):
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@storefront.route('/')
 def index():
-    software = Software.query.all()
-    return render_template('index.html', software=software)
+    after, limit = _catalog_args()
+    state = catalog_state()
+    etag, last_modified = _catalog_validators(state, limit, per_user=True)
+    if _not_modified(etag, last_modified):
+        return _conditional(Response(status=304), etag, last_modified)
+
+    page = cached_catalog_page(state, after, limit)
+    cards_key = 'catalog:%s:cards:%s:%d:%d' % (
+        state['version'], request.args.get('cursor', ''), limit, current_user.is_authenticated)
+    cards = cache.get_or_set(cards_key, lambda: render_template('_catalog_cards.html', software=page['items']))
+    response = make_response(render_template('index.html', cards=Markup(cards), next_cursor=page['next_cursor'],
+                                             is_first_page=after is None))
+    return _conditional(response, etag, last_modified)
+
+@storefront.route('/api/catalog')
+def catalog_api():
+    after, limit = _catalog_args()
+    state = catalog_state()
+    etag, last_modified = _catalog_validators(state, limit, per_user=False)
+    if _not_modified(etag, last_modified):
+        return _conditional(Response(status=304), etag, last_modified)
+    return _conditional(jsonify(cached_catalog_page(state, after, limit)), etag, last_modified)
+
+@storefront.route('/api/catalog/stream')
+def catalog_stream():
+    after, limit = _catalog_args()
+
+    # One JSON object per line, flushed page by page so the first bytes go
+    # out after a single keyset query regardless of catalog size.
+    def generate():
+        for software, _ in iter_catalog_pages(after, limit):
+            for s in software:
+                yield json.dumps(software_to_dict(s)) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
-@app.route('/login', methods=['GET', 'POST'])
+# Products added, changed or deleted after the client's last seen seq.
+# Start from since=0 for a full copy, then keep passing next_since.
+@storefront.route('/api/catalog/changes')
+def catalog_changes_api():
+    since = request.args.get('since', '0')
+    if not since.isdigit():
+        abort(400)
+    limit = request.args.get('limit', type=int) or current_app.config['CATALOG_CHANGES_PAGE_SIZE']
+    limit = max(1, min(limit, current_app.config['CATALOG_CHANGES_MAX_PAGE_SIZE']))
+    return jsonify(catalog_changes(int(since), limit))
+
+def _search_args():
+    q = request.args.get('q', '').strip()
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = current_app.config['SEARCH_PAGE_SIZE']
+    # Fetch one extra row to know whether there is a next page
+    results = search_software(db.session, q, limit=per_page + 1, offset=(page - 1) * per_page)
+    return q, page, results[:per_page], len(results) > per_page
+
+@storefront.route('/search')
+def search():
+    q, page, software, has_next = _search_args()
+    return render_template('search.html', q=q, page=page, software=software, has_next=has_next)
+
+@storefront.route('/api/search')
+def search_api():
+    q, page, software, has_next = _search_args()
+    return jsonify({
+        'q': q,
+        'page': page,
+        'items': [software_to_dict(s) for s in software],
+        'has_next': has_next,
+    })
+
+def _library_args():
+    limit = request.args.get('limit', type=int) or current_app.config['LIBRARY_PAGE_SIZE']
+    limit = max(1, min(limit, current_app.config['LIBRARY_MAX_PAGE_SIZE']))
+    try:
+        after = parse_library_cursor(request.args.get('cursor'))
+    except InvalidCursor:
+        abort(400)
+    return after, limit
+
+@storefront.route('/library')
+@login_required
+def library():
+    after, limit = _library_args()
+    items, next_cursor = library_page(current_user.id, after, limit)
+    return render_template('library.html', items=items, next_cursor=next_cursor,
+                           total=library_count(current_user.id), is_first_page=after is None)
+
+@storefront.route('/api/library')
+@login_required
+def library_api():
+    after, limit = _library_args()
+    items, next_cursor = library_page(current_user.id, after, limit)
+    return jsonify({'items': items, 'next_cursor': next_cursor, 'total': library_count(current_user.id)})
+
+@storefront.route('/api/licenses/<key>')
+def license_api(key):
+    license = validate_license_key(key)
+    if license is None:
+        return jsonify({'valid': False}), 404
+    return jsonify(dict(license, valid=True))
+
+@storefront.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
+        limit_auth_attempt(request.remote_addr, email)
         user = User.query.filter_by(email=email).first()
         
-        if user and check_password_hash(user.password_hash, password):
+        if user and verify_password(user.password_hash, password):
+            if needs_rehash(user.password_hash):
+                user.password_hash = hash_password(password)
+                db.session.commit()
             login_user(user)
-            return redirect(url_for('index'))
+            return redirect(url_for('.index'))
         
         flash('Invalid email or password')
     return render_template('login.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@storefront.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         username = request.form.get('username')
         email = request.form.get('email')
         password = request.form.get('password')
+        limit_auth_attempt(request.remote_addr)
         
         if User.query.filter_by(email=email).first():
             flash('Email already exists')
-            return redirect(url_for('register'))
+            return redirect(url_for('.register'))
             
         new_user = User(
             username=username,
             email=email,
-            password_hash=generate_password_hash(password),
+            password_hash=hash_password(password),
             is_admin=False
         )
         db.session.add(new_user)
+        db.session.flush()
+        enqueue_welcome_email(new_user)
         db.session.commit()
         
         flash('Registration successful! Please log in.')
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     return render_template('register.html')
 
-@app.route('/logout')
+@storefront.route('/logout')
 @login_required
 def logout():
+    forget_user(current_user.id)
     logout_user()
-    return redirect(url_for('index'))
+    return redirect(url_for('.index'))
 
-@app.route('/admin')
+@storefront.route('/admin')
 @login_required
 def admin():
     if not current_user.is_admin:
         flash('Access denied')
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
     
-    users = User.query.all()
     software = Software.query.all()
-    purchases = Purchase.query.all()
-    return render_template('admin.html', users=users, software=software, purchases=purchases)
+    return render_template('admin.html', software=software, sales=sales_by_software())
+
+# Reads only the sales rollups, so the cost depends on the number of products
+# and days requested, not on how many purchases exist.
+@storefront.route('/admin/analytics')
+@login_required
+def analytics():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied'}), 403
+    days = max(1, min(request.args.get('days', 30, type=int), 366))
+    limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+    by = request.args.get('by', 'revenue')
+    if by not in ('revenue', 'purchases'):
+        return jsonify({'error': 'by must be revenue or purchases'}), 400
+    return jsonify({
+        'top_sellers': top_sellers(limit, by),
+        'revenue': revenue_series(days, request.args.get('software_id', type=int)),
+    })
+
+@storefront.route('/admin/cache_stats')
+@login_required
+def cache_stats():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied'}), 403
+    return jsonify(cache.stats())
+
+@storefront.route('/admin/import', methods=['POST'])
+@login_required
+def import_catalog():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied'}), 403
+
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'error': 'No file uploaded'}), 400
+    fmt = request.form.get('format') or detect_format(upload.filename)
+    if fmt not in FORMATS:
+        return jsonify({'error': 'Unsupported format'}), 400
+
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+    report = import_software(iter_records(stream, fmt))
+    return jsonify(report.to_dict())
+
+@storefront.route('/admin/export/<kind>.<fmt>')
+@login_required
+def export_data(kind, fmt):
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied'}), 403
+    if kind not in EXPORTS or fmt not in FORMATS:
+        abort(404)
 
-@app.route('/add_software', methods=['POST'])
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = Response(stream_with_context(export_rows(kind, fmt)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = 'attachment; filename=%s.%s' % (kind, fmt)
+    return response
+
+@storefront.route('/add_software', methods=['POST'])
 @login_required
 def add_software():
     if not current_user.is_admin:
@@ -88,25 +298,47 @@ def add_software():
         license_key=license_key
     )
     db.session.add(new_software)
+    db.session.flush()
+    enqueue_thumbnails(new_software)
     db.session.commit()
+    invalidate_catalog()
     
     return jsonify({'message': 'Software added successfully'})
 
-@app.route('/purchase/<int:software_id>')
+def _idempotency_key(value):
+    value = (value or '').strip()
+    if len(value) > MAX_KEY_LENGTH:
+        abort(400)
+    return value or None
+
+
+@storefront.route('/purchase/<int:software_id>', methods=['POST'])
 @login_required
 def purchase(software_id):
     software = Software.query.get_or_404(software_id)
-    
-    def generate_license_key():
-        chars = string.ascii_uppercase + string.digits
-        return ''.join(random.choice(chars) for _ in range(20))
-    
-    new_purchase = Purchase(
-        user_id=current_user.id,
-        software_id=software_id,
-        license_key=generate_license_key()
-    )
-    db.session.add(new_purchase)
-    db.session.commit()
-    
-    return redirect(url_for('index'))
+    key = _idempotency_key(request.form.get('idempotency_key'))
+    try:
+        purchase_software(current_user.id, software.id, key)
+    except IdempotencyConflict:
+        abort(422)
+    flash('Purchase successful! Your license key is available in your library.')
+    return redirect(url_for('.index'))
+
+
+# Clients send an Idempotency-Key header; retrying with the same key returns
+# the original purchase (200) instead of buying again (201).
+@storefront.route('/api/purchases', methods=['POST'])
+@login_required
+def api_purchase():
+    key = _idempotency_key(request.headers.get('Idempotency-Key'))
+    if key is None:
+        return jsonify({'error': 'Idempotency-Key header is required'}), 400
+    data = request.get_json(silent=True) or {}
+    software_id = data.get('software_id')
+    if not isinstance(software_id, int) or db.session.get(Software, software_id) is None:
+        return jsonify({'error': 'Unknown software_id'}), 404
+    try:
+        purchase, created = purchase_software(current_user.id, software_id, key)
+    except IdempotencyConflict as e:
+        return jsonify({'error': str(e)}), 422
+    return jsonify(dict(purchase_to_dict(purchase), replayed=not created)), 201 if created else 200
@@ -0,0 +1,96 @@
+import re
+
+from sqlalchemy import column, or_, select, table, text
+
+from software_store_app.models import Software
+
+# External-content FTS5 index over software.name/description. The triggers
+# keep it in sync with every write to the software table, whichever app or
+# code path makes it, so the routes never have to touch it directly.
+SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS software_fts USING fts5(
+        name, description,
+        content='software', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS software_fts_ai AFTER INSERT ON software BEGIN
+        INSERT INTO software_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS software_fts_ad AFTER DELETE ON software BEGIN
+        INSERT INTO software_fts(software_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS software_fts_au AFTER UPDATE OF name, description ON software BEGIN
+        INSERT INTO software_fts(software_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO software_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+]
+
+# bm25 column weights: a hit in the name counts ten times one in the description
+RANK = text('bm25(software_fts, 10.0, 1.0)')
+
+software_fts = table('software_fts', column('rowid'))
+
+
+# FTS5 is SQLite-only; other backends fall back to LIKE matching in
+# search_software() and need no schema.
+def install_search(engine):
+    if engine.dialect.name != 'sqlite':
+        return
+    with engine.begin() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'software_fts'"
+        )).first()
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+        if not exists:
+            conn.execute(text("INSERT INTO software_fts(software_fts) VALUES ('rebuild')"))
+
+
+# Turns free text into an FTS5 query where every word must match as a prefix,
+# e.g. 'photo edi' -> '"photo"* "edi"*'. Quoting each token keeps user input
+# from being parsed as FTS5 syntax.
+def build_match(q):
+    tokens = re.findall(r'\w+', q or '')
+    if not tokens:
+        return None
+    return ' '.join('"%s"*' % token for token in tokens[:16])
+
+
+def search_query(match):
+    return (
+        select(Software)
+        .join(software_fts, software_fts.c.rowid == Software.id)
+        .where(text('software_fts MATCH :match').bindparams(match=match))
+        .order_by(RANK)
+    )
+
+
+def like_query(q):
+    conditions = []
+    for token in re.findall(r'\w+', q)[:16]:
+        pattern = '%' + token + '%'
+        conditions.append(or_(Software.name.like(pattern), Software.description.like(pattern)))
+    return select(Software).where(*conditions).order_by(Software.name, Software.id)
+
+
+def search_software(session, q, limit=20, offset=0):
+    match = build_match(q)
+    if match is None:
+        return []
+    if session.get_bind().dialect.name != 'sqlite':
+        query = like_query(q)
+    else:
+        query = search_query(match)
+    return session.scalars(query.limit(limit).offset(offset)).all()
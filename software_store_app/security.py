@@ -0,0 +1,111 @@
+import hashlib
+import hmac
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from software_store_app.greenlets import run_blocking, wait
+from software_store_app.ratelimit import RateLimited, TokenBucket
+
+
+class HashingBusy(Exception):
+    pass
+
+
+# Runs the password KDF on a small dedicated pool. At most
+# PASSWORD_HASH_WORKERS hashes run at once and at most PASSWORD_HASH_QUEUE
+# more may wait; anything beyond that fails fast with HashingBusy instead of
+# tying up a request worker behind a login storm.
+class PasswordHasher:
+    def __init__(self, method, salt_length, workers, queue, wait):
+        self.method = method
+        self.salt_length = salt_length
+        self.wait = wait
+        self._prefix = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + queue)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False) and not run_blocking(self._slots.acquire, True, self.wait):
+            raise HashingBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return wait(future)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, password_hash, password):
+        if not password_hash:
+            return False
+        return self._run(check_password_hash, password_hash, password)
+
+    # Werkzeug prefixes each hash with its method and parameters, e.g.
+    # 'scrypt:32768:8:1$salt$hash', so a parameter change is visible per user.
+    # Short method names are stored expanded ('scrypt' as 'scrypt:32768:8:1'),
+    # so the prefix to expect is taken from one probe hash, made on first use
+    # rather than at start-up.
+    def needs_rehash(self, password_hash):
+        if self._prefix is None:
+            self._prefix = self.hash('').split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._prefix
+
+
+def init_security(app):
+    app.extensions['password_hasher'] = PasswordHasher(
+        app.config['PASSWORD_HASH_METHOD'],
+        app.config['PASSWORD_SALT_LENGTH'],
+        app.config['PASSWORD_HASH_WORKERS'],
+        app.config['PASSWORD_HASH_QUEUE'],
+        app.config['PASSWORD_HASH_WAIT'],
+    )
+    app.extensions['auth_rate_limits'] = {
+        'ip': TokenBucket(*app.config['AUTH_RATE_LIMIT_PER_IP']),
+        'account': TokenBucket(*app.config['AUTH_RATE_LIMIT_PER_ACCOUNT']),
+    }
+    app.register_error_handler(HashingBusy, _hashing_busy)
+    app.register_error_handler(RateLimited, _rate_limited)
+
+
+def _hashing_busy(e):
+    return 'The server is busy, please try again in a moment.', 503, {'Retry-After': '1'}
+
+
+def _rate_limited(e):
+    return 'Too many attempts, please try again later.', 429, {'Retry-After': str(e.retry_after)}
+
+
+def hash_password(password):
+    return current_app.extensions['password_hasher'].hash(password)
+
+
+def verify_password(password_hash, password):
+    return current_app.extensions['password_hasher'].verify(password_hash, password)
+
+
+def needs_rehash(password_hash):
+    return current_app.extensions['password_hasher'].needs_rehash(password_hash)
+
+
+# Stamp stored in the session next to the user id. It changes with the
+# password and the admin flag, so such changes end existing sessions.
+def session_stamp(user):
+    key = current_app.config['SECRET_KEY']
+    key = key.encode() if isinstance(key, str) else key
+    message = '%s:%s' % (user.password_hash, bool(user.is_admin))
+    return hmac.new(key, message.encode(), hashlib.sha256).hexdigest()[:16]
+
+
+# Cheap check done before any hashing. Raises RateLimited when either the
+# client address or the targeted account is out of tokens.
+def limit_auth_attempt(remote_addr, account=None):
+    limits = current_app.extensions['auth_rate_limits']
+    limits['ip'].consume('ip:%s' % remote_addr)
+    if account:
+        limits['account'].consume('account:%s' % account.strip().lower())
@@ -0,0 +1,25 @@
+import pytest
+
+from software_store_app import create_app, db
+from software_store_app.database import create_schema
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db'),
+        'JOBS_WORKERS': 0,
+        # Cheap hashes; the tests are not about the KDF
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+    })
+    with app.app_context():
+        create_schema(db)
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,39 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func, select
+
+from software_store_app import db
+from software_store_app.models import Purchase, Software, User
+
+REPLAYS = 16
+
+
+def test_concurrent_replays_purchase_once(app):
+    with app.app_context():
+        user = User(username='buyer', email='buyer@example.com', password_hash='!')
+        software = Software(name='Product', description='d', price=1.0, license_key='SW-1')
+        db.session.add_all([user, software])
+        db.session.commit()
+        session_id, software_id = user.get_id(), software.id
+
+    start = threading.Barrier(REPLAYS)
+
+    def send(_):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = session_id
+            sess['_fresh'] = True
+        start.wait()
+        response = client.post('/api/purchases', json={'software_id': software_id},
+                               headers={'Idempotency-Key': 'same-key'})
+        return response.status_code, response.get_json()
+
+    with ThreadPoolExecutor(REPLAYS) as pool:
+        results = list(pool.map(send, range(REPLAYS)))
+
+    statuses = sorted(status for status, _ in results)
+    assert statuses == [200] * (REPLAYS - 1) + [201]
+    assert len({body['license_key'] for _, body in results}) == 1
+    with app.app_context():
+        assert db.session.scalar(select(func.count()).select_from(Purchase)) == 1
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from software_store_app import db
+from software_store_app.models import Purchase, Software, User
+from software_store_app.querycount import assert_max_queries
+from software_store_app.security import hash_password
+
+PASSWORD = 'password'
+
+
+def seed(rows):
+    admin = User(username='admin', email='admin@example.com', password_hash=hash_password(PASSWORD), is_admin=True)
+    db.session.add(admin)
+    users = [User(username='user%d' % i, email='user%d@example.com' % i, password_hash='x') for i in range(rows)]
+    software = [Software(name='Product %d' % i, description='d', price=10.0 + i, license_key='SW-%d' % i)
+                for i in range(rows)]
+    db.session.add_all(users + software)
+    db.session.flush()
+    start = datetime(2024, 1, 1)
+    for i in range(rows):
+        db.session.add(Purchase(user_id=users[i].id, software_id=software[(i * 7) % rows].id,
+                                license_key='LK-%d' % i, purchase_date=start + timedelta(hours=i)))
+    db.session.commit()
+
+
+def login_admin(client, path):
+    response = client.post(path, data={'email': 'admin@example.com', 'password': PASSWORD})
+    assert response.status_code == 302
+
+
+# The number of statements must not grow with the number of rows shown;
+# a per-row lazy load of a purchase's user or product would add one per row.
+@pytest.mark.parametrize('rows', [5, 50])
+def test_admin_dashboard(app, client, rows):
+    with app.app_context():
+        seed(rows)
+    login_admin(client, '/login')
+    with app.app_context():
+        with assert_max_queries(db.engine, 3):
+            response = client.get('/admin')
+    assert response.status_code == 200
+    assert b'Product %d' % (rows - 1) in response.data
+
+
+@pytest.mark.parametrize('rows', [5, 50])
+def test_editor_purchases_grid(app, client, rows):
+    with app.app_context():
+        seed(rows)
+    login_admin(client, '/editor/login')
+    with app.app_context():
+        with assert_max_queries(db.engine, 3):
+            response = client.get('/editor/api/purchases?limit=100')
+    assert response.status_code == 200
+    items = response.get_json()['items']
+    assert len(items) == rows
+    assert all(item['username'] and item['software_name'] for item in items)